@@ -0,0 +1,43 @@
+"""Change feed versions
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+TABLES = ('buildings', 'activities', 'organizations')
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE entity_version_seq")
+
+    for table in TABLES:
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(timezone=True),
+            server_default=sa.text('now()'), nullable=False
+        ))
+        # server_default заполняет существующие строки значениями из последовательности
+        op.add_column(table, sa.Column(
+            'version', sa.BigInteger(),
+            server_default=sa.text("nextval('entity_version_seq')"), nullable=False
+        ))
+        op.create_index(op.f(f'ix_{table}_version'), table, ['version'], unique=False)
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.drop_index(op.f(f'ix_{table}_version'), table_name=table)
+        op.drop_column(table, 'version')
+        op.drop_column(table, 'updated_at')
+
+    op.execute("DROP SEQUENCE entity_version_seq")
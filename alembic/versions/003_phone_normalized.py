@@ -0,0 +1,56 @@
+"""Normalized phone numbers
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('phones', sa.Column('normalized', sa.String(), nullable=True))
+
+    # Backfill: только цифры, российские номера к виду 7XXXXXXXXXX (как app.phones.normalize_phone)
+    op.execute(r"UPDATE phones SET normalized = regexp_replace(number, '[^0-9]', '', 'g')")
+    op.execute(
+        "UPDATE phones SET normalized = '7' || substr(normalized, 2) "
+        "WHERE length(normalized) = 11 AND normalized LIKE '8%'"
+    )
+    op.execute("UPDATE phones SET normalized = '7' || normalized WHERE length(normalized) = 10")
+
+    # Номера, совпавшие после нормализации, сливаем в телефон с наименьшим id
+    op.execute("""
+        UPDATE organization_phone op SET phone_id = d.keep_id
+        FROM (SELECT id, min(id) OVER (PARTITION BY normalized) AS keep_id FROM phones) d
+        WHERE op.phone_id = d.id AND d.id <> d.keep_id
+    """)
+    op.execute("""
+        DELETE FROM organization_phone a USING organization_phone b
+        WHERE a.ctid < b.ctid
+          AND a.organization_id = b.organization_id
+          AND a.phone_id = b.phone_id
+    """)
+    op.execute("""
+        DELETE FROM phones p
+        USING (SELECT id, min(id) OVER (PARTITION BY normalized) AS keep_id FROM phones) d
+        WHERE p.id = d.id AND d.id <> d.keep_id
+    """)
+
+    op.alter_column('phones', 'normalized', nullable=False)
+    op.create_index(op.f('ix_phones_normalized'), 'phones', ['normalized'], unique=True)
+    op.create_index(op.f('ix_organization_phone_phone_id'), 'organization_phone', ['phone_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_organization_phone_phone_id'), table_name='organization_phone')
+    op.drop_index(op.f('ix_phones_normalized'), table_name='phones')
+    op.drop_column('phones', 'normalized')
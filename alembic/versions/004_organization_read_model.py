@@ -0,0 +1,75 @@
+"""Organization read model
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('organization_read',
+    sa.Column('organization_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('building_id', sa.Integer(), nullable=False),
+    sa.Column('address', sa.String(), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.Column('phones', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('activity_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('activity_ancestor_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.ForeignKeyConstraint(['organization_id'], ['organizations.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('organization_id')
+    )
+    op.create_index(op.f('ix_organization_read_building_id'), 'organization_read', ['building_id'], unique=False)
+    op.create_index('ix_organization_read_lat_lon', 'organization_read', ['latitude', 'longitude'], unique=False)
+    op.create_index('ix_organization_read_activity_ancestor_ids', 'organization_read', ['activity_ancestor_ids'],
+                    unique=False, postgresql_using='gin')
+
+    # Заполняем модель чтения по существующим организациям
+    op.execute("""
+        INSERT INTO organization_read (
+            organization_id, name, building_id, address, latitude, longitude,
+            phones, activity_ids, activity_ancestor_ids
+        )
+        SELECT
+            o.id, o.name, b.id, b.address, b.latitude, b.longitude,
+            COALESCE((
+                SELECT jsonb_agg(jsonb_build_object('id', p.id, 'number', p.number) ORDER BY p.id)
+                FROM organization_phone op JOIN phones p ON p.id = op.phone_id
+                WHERE op.organization_id = o.id
+            ), '[]'::jsonb),
+            COALESCE((
+                SELECT array_agg(DISTINCT oa.activity_id ORDER BY oa.activity_id)
+                FROM organization_activity oa
+                WHERE oa.organization_id = o.id
+            ), '{}'),
+            COALESCE((
+                WITH RECURSIVE ancestors(id) AS (
+                    SELECT oa.activity_id FROM organization_activity oa WHERE oa.organization_id = o.id
+                    UNION
+                    SELECT a.parent_id FROM activities a JOIN ancestors ON a.id = ancestors.id
+                    WHERE a.parent_id IS NOT NULL
+                )
+                SELECT array_agg(id ORDER BY id) FROM ancestors
+            ), '{}')
+        FROM organizations o
+        JOIN buildings b ON b.id = o.building_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_organization_read_activity_ancestor_ids', table_name='organization_read')
+    op.drop_index('ix_organization_read_lat_lon', table_name='organization_read')
+    op.drop_index(op.f('ix_organization_read_building_id'), table_name='organization_read')
+    op.drop_table('organization_read')
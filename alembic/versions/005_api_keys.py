@@ -0,0 +1,48 @@
+"""API keys
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+# SHA-256 прежнего общего ключа "orgatlas_api_key", чтобы существующие клиенты продолжили работать
+LEGACY_KEY_HASH = '3540d21bfd0d09d11b267563df941946e5eddbb21e165d9c1371c2e64c8786f7'
+
+
+def upgrade() -> None:
+    api_keys = op.create_table('api_keys',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('key_hash', sa.String(), nullable=False),
+    sa.Column('rate_per_second', sa.Float(), nullable=False),
+    sa.Column('burst', sa.Integer(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_api_keys_id'), 'api_keys', ['id'], unique=False)
+    op.create_index(op.f('ix_api_keys_key_hash'), 'api_keys', ['key_hash'], unique=True)
+
+    op.bulk_insert(api_keys, [{
+        'name': 'legacy',
+        'key_hash': LEGACY_KEY_HASH,
+        'rate_per_second': 50.0,
+        'burst': 100,
+        'is_active': True,
+    }])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_api_keys_key_hash'), table_name='api_keys')
+    op.drop_index(op.f('ix_api_keys_id'), table_name='api_keys')
+    op.drop_table('api_keys')
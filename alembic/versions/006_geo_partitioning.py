@@ -0,0 +1,125 @@
+"""Geo cells and partitioned organization read model
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+# Должно совпадать с app.geo: ячейки 1x1 градус, секции - полосы широт по 5 градусов
+CELLS_PER_ROW = 360
+CELL_ROWS = 180
+ROWS_PER_BAND = 5
+
+GEO_CELL_SQL = (
+    "LEAST({rows} - 1, GREATEST(0, floor({lat} + 90)::int)) * {per_row}"
+    " + LEAST({per_row} - 1, GREATEST(0, floor({lon} + 180)::int))"
+)
+
+BACKFILL_SQL = """
+    INSERT INTO organization_read (
+        organization_id, {geo_cell_column}name, building_id, address, latitude, longitude,
+        phones, activity_ids, activity_ancestor_ids
+    )
+    SELECT
+        o.id, {geo_cell_value}o.name, b.id, b.address, b.latitude, b.longitude,
+        COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('id', p.id, 'number', p.number) ORDER BY p.id)
+            FROM organization_phone op JOIN phones p ON p.id = op.phone_id
+            WHERE op.organization_id = o.id
+        ), '[]'::jsonb),
+        COALESCE((
+            SELECT array_agg(DISTINCT oa.activity_id ORDER BY oa.activity_id)
+            FROM organization_activity oa
+            WHERE oa.organization_id = o.id
+        ), '{{}}'),
+        COALESCE((
+            WITH RECURSIVE ancestors(id) AS (
+                SELECT oa.activity_id FROM organization_activity oa WHERE oa.organization_id = o.id
+                UNION
+                SELECT a.parent_id FROM activities a JOIN ancestors ON a.id = ancestors.id
+                WHERE a.parent_id IS NOT NULL
+            )
+            SELECT array_agg(id ORDER BY id) FROM ancestors
+        ), '{{}}')
+    FROM organizations o
+    JOIN buildings b ON b.id = o.building_id
+"""
+
+
+def partition_bounds():
+    for first_row in range(0, CELL_ROWS, ROWS_PER_BAND):
+        south = first_row - 90
+        suffix = f"s{-south}" if south < 0 else f"n{south}"
+        yield suffix, first_row * CELLS_PER_ROW, (first_row + ROWS_PER_BAND) * CELLS_PER_ROW
+
+
+def read_model_columns():
+    return [
+        sa.Column('organization_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('building_id', sa.Integer(), nullable=False),
+        sa.Column('address', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('phones', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('activity_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column('activity_ancestor_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.ForeignKeyConstraint(['organization_id'], ['organizations.id'], ondelete='CASCADE'),
+    ]
+
+
+def upgrade() -> None:
+    op.add_column('buildings', sa.Column('geo_cell', sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE buildings SET geo_cell = "
+        + GEO_CELL_SQL.format(rows=CELL_ROWS, per_row=CELLS_PER_ROW, lat='latitude', lon='longitude')
+    )
+    op.alter_column('buildings', 'geo_cell', nullable=False)
+    op.create_index(op.f('ix_buildings_geo_cell'), 'buildings', ['geo_cell'], unique=False)
+
+    # Модель чтения - производные данные: пересоздаём её секционированной и заполняем заново
+    op.drop_table('organization_read')
+    op.create_table('organization_read',
+    sa.Column('geo_cell', sa.Integer(), nullable=False),
+    *read_model_columns(),
+    sa.PrimaryKeyConstraint('organization_id', 'geo_cell'),
+    postgresql_partition_by='RANGE (geo_cell)'
+    )
+    for suffix, start, end in partition_bounds():
+        op.execute(
+            f"CREATE TABLE organization_read_{suffix} PARTITION OF organization_read "
+            f"FOR VALUES FROM ({start}) TO ({end})"
+        )
+    op.create_index(op.f('ix_organization_read_building_id'), 'organization_read', ['building_id'], unique=False)
+    op.create_index('ix_organization_read_geo_cell_lat_lon', 'organization_read',
+                    ['geo_cell', 'latitude', 'longitude'], unique=False)
+    op.create_index('ix_organization_read_activity_ancestor_ids', 'organization_read', ['activity_ancestor_ids'],
+                    unique=False, postgresql_using='gin')
+    op.execute(BACKFILL_SQL.format(geo_cell_column='geo_cell, ', geo_cell_value='b.geo_cell, '))
+
+
+def downgrade() -> None:
+    op.drop_table('organization_read')
+    op.create_table('organization_read',
+    *read_model_columns(),
+    sa.PrimaryKeyConstraint('organization_id')
+    )
+    op.create_index(op.f('ix_organization_read_building_id'), 'organization_read', ['building_id'], unique=False)
+    op.create_index('ix_organization_read_lat_lon', 'organization_read', ['latitude', 'longitude'], unique=False)
+    op.create_index('ix_organization_read_activity_ancestor_ids', 'organization_read', ['activity_ancestor_ids'],
+                    unique=False, postgresql_using='gin')
+    op.execute(BACKFILL_SQL.format(geo_cell_column='', geo_cell_value=''))
+
+    op.drop_index(op.f('ix_buildings_geo_cell'), table_name='buildings')
+    op.drop_column('buildings', 'geo_cell')
@@ -0,0 +1,37 @@
+"""Change feed transaction ids
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+TABLES = ('buildings', 'activities', 'organizations')
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        # Существующие строки получают xid этой миграции: к чтению ленты она уже зафиксирована
+        op.add_column(table, sa.Column(
+            'xact_id', sa.BigInteger(),
+            server_default=sa.text('pg_current_xact_id()::text::bigint'), nullable=False
+        ))
+        op.create_index(f'ix_{table}_xact_id_version', table, ['xact_id', 'version'], unique=False)
+        # Лента читает по (xact_id, version), индекс по одной версии больше не нужен
+        op.drop_index(op.f(f'ix_{table}_version'), table_name=table)
+
+
+def downgrade() -> None:
+    for table in reversed(TABLES):
+        op.create_index(op.f(f'ix_{table}_version'), table, ['version'], unique=False)
+        op.drop_index(f'ix_{table}_xact_id_version', table_name=table)
+        op.drop_column(table, 'xact_id')
@@ -0,0 +1,115 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from fastapi import Depends, HTTPException
+
+from app.auth import verify_api_key
+from app.database import EXPORT_MAX_CONNECTIONS
+
+# Через сколько секунд клиенту стоит повторить отклонённый запрос
+RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# Сколько запрос может ждать в очереди, прежде чем будет отклонён
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+
+
+class AdmissionController:
+    """Ограничение числа одновременных запросов к базе для класса эндпоинтов.
+
+    Не больше max_in_flight запросов выполняются одновременно, ещё max_queue
+    ждут в очереди не дольше queue_timeout секунд. Остальные сразу получают
+    503 с Retry-After, не занимая соединения из пула.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float = QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def _reject(self) -> HTTPException:
+        self.shed += 1
+        return HTTPException(
+            status_code=503,
+            detail="Сервис перегружен, повторите запрос позже",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занять место на время выполнения запроса"""
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                raise self._reject()
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject()
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Текущая загрузка и счётчики отклонённых запросов"""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+def _controller(name: str, max_in_flight: int, max_queue: int) -> AdmissionController:
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionController(
+        name,
+        max_in_flight=int(os.getenv(f"{prefix}_LIMIT", str(max_in_flight))),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", str(max_queue))),
+    )
+
+
+# Классы эндпоинтов: дешёвые выборки по ключу, тяжёлые выборки (гео и
+# поддеревья видов деятельности) и запись. В сумме лимиты не превышают
+# размер пула SQLAlchemy по умолчанию (5 + 10 overflow). Выгрузка читает
+# через собственный пул и ограничена его размером.
+admission_controllers: Dict[str, AdmissionController] = {
+    "lookup": _controller("lookup", 8, 100),
+    "scan": _controller("scan", 4, 50),
+    "write": _controller("write", 2, 20),
+    "export": AdmissionController("export", max_in_flight=EXPORT_MAX_CONNECTIONS, max_queue=2),
+}
+
+
+def admit(route_class: str):
+    """Зависимость FastAPI, пропускающая запрос через контроллер класса route_class.
+
+    Ключ и его лимит проверяются до того, как запрос займёт место: запросы
+    без ключа и сверх лимита тенанта не попадают в общую очередь. FastAPI
+    кэширует зависимость в пределах запроса, поэтому verify_api_key в
+    параметрах эндпоинта не вызывается повторно.
+    """
+    controller = admission_controllers[route_class]
+
+    async def dependency(api_key: str = Depends(verify_api_key)):
+        async with controller.slot():
+            yield
+
+    return dependency
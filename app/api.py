@@ -1,25 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.database import get_db
-from app.schemas import Organization, Building, Activity, OrganizationCreate, BuildingCreate, ActivityCreate
-from app.services import OrganizationService, BuildingService, ActivityService
+from typing import Callable, List, Optional
+import os
+import secrets
+from app.database import get_db, SessionLocal
+from app.schemas import Organization, Building, Activity, OrganizationCreate, BuildingCreate, ActivityCreate, ChangeFeed, ActivityFacet, Suggestion, ApiKeyCreate, ApiKeyInfo, ApiKeyCreated
+from app.admission import admission_controllers, admit
+from app.auth import api_key_cache, generate_key, hash_key, verify_api_key
+from app.autocomplete import autocomplete_index
+from app.coalescing import SingleFlight, make_key
+from app.compression import cached_json_response
+from app.invalidation import change_listener, register_invalidator
+from app import export, profiling
+from app.services import OrganizationService, BuildingService, ActivityService, ChangeService, ApiKeyService
 
 router = APIRouter()
 
-# API Key для аутентификации
-API_KEY = "orgatlas_api_key"
+# Токен для служебных эндпоинтов (пустой - служебные эндпоинты закрыты)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
-def verify_api_key(api_key: str = Query(..., description="API ключ")):
-    """Проверка API ключа"""
-    if api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Неверный API ключ")
-    return api_key
+def verify_admin_token(x_admin_token: str = Header("", description="Служебный токен")):
+    """Проверка служебного токена"""
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return x_admin_token
+
+
+# Объединение одинаковых одновременных тяжёлых запросов
+organizations_flight = SingleFlight(
+    ttl=float(os.getenv("COALESCE_TTL_SECONDS", "0")),
+    admission=admission_controllers["scan"],
+)
+register_invalidator({"building", "activity", "organization"}, lambda change: organizations_flight.clear())
+
+
+def load_organizations(query: Callable[..., list], *args) -> List[Organization]:
+    """Выполнить запрос в отдельной сессии и вернуть сериализованный результат.
 
+    Результат разделяется между несколькими запросами, поэтому ORM-объекты
+    преобразуются в схемы до закрытия сессии.
+    """
+    db = SessionLocal()
+    try:
+        return [Organization.model_validate(org) for org in query(db, *args)]
+    finally:
+        db.close()
+
+
+# Эндпоинты, работающие с сессией базы, объявлены через def: FastAPI выполняет
+# их в пуле потоков, синхронные запросы SQLAlchemy не блокируют цикл событий,
+# и контроллер нагрузки успевает отклонять лишние запросы.
 
 # Эндпоинты для организаций
-@router.get("/organizations/by-building/{building_id}", response_model=List[Organization])
-async def get_organizations_by_building(
+@router.get("/organizations/by-building/{building_id}", response_model=List[Organization], dependencies=[Depends(admit("lookup"))])
+def get_organizations_by_building(
     building_id: int,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
@@ -32,12 +69,13 @@ async def get_organizations_by_building(
 @router.get("/organizations/by-activity/{activity_id}", response_model=List[Organization])
 async def get_organizations_by_activity(
     activity_id: int,
-    api_key: str = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    api_key: str = Depends(verify_api_key)
 ):
     """Получить все организации по виду деятельности (включая дочерние)"""
-    organizations = OrganizationService.get_organizations_by_activity(db, activity_id)
-    return organizations
+    return await organizations_flight.do(
+        make_key("organizations_by_activity", activity_id=activity_id),
+        load_organizations, OrganizationService.get_organizations_by_activity, activity_id
+    )
 
 
 @router.get("/organizations/in-radius", response_model=List[Organization])
@@ -45,12 +83,13 @@ async def get_organizations_in_radius(
     latitude: float = Query(..., description="Широта"),
     longitude: float = Query(..., description="Долгота"),
     radius_km: float = Query(..., description="Радиус в километрах"),
-    api_key: str = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    api_key: str = Depends(verify_api_key)
 ):
     """Получить организации в радиусе от точки"""
-    organizations = OrganizationService.get_organizations_in_radius(db, latitude, longitude, radius_km)
-    return organizations
+    return await organizations_flight.do(
+        make_key("organizations_in_radius", latitude=latitude, longitude=longitude, radius_km=radius_km),
+        load_organizations, OrganizationService.get_organizations_in_radius, latitude, longitude, radius_km
+    )
 
 
 @router.get("/organizations/in-rectangle", response_model=List[Organization])
@@ -59,18 +98,32 @@ async def get_organizations_in_rectangle(
     max_lat: float = Query(..., description="Максимальная широта"),
     min_lon: float = Query(..., description="Минимальная долгота"),
     max_lon: float = Query(..., description="Максимальная долгота"),
+    api_key: str = Depends(verify_api_key)
+):
+    """Получить организации в прямоугольной области (min_lon > max_lon - через антимеридиан)"""
+    return await organizations_flight.do(
+        make_key(
+            "organizations_in_rectangle",
+            min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon
+        ),
+        load_organizations, OrganizationService.get_organizations_in_rectangle,
+        min_lat, max_lat, min_lon, max_lon
+    )
+
+
+@router.get("/organizations/by-phone", response_model=List[Organization], dependencies=[Depends(admit("lookup"))])
+def get_organizations_by_phone(
+    phone: str = Query(..., description="Номер телефона в любом формате"),
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
 ):
-    """Получить организации в прямоугольной области"""
-    organizations = OrganizationService.get_organizations_in_rectangle(
-        db, min_lat, max_lat, min_lon, max_lon
-    )
+    """Получить организации, которым принадлежит номер телефона"""
+    organizations = OrganizationService.get_organizations_by_phone(db, phone)
     return organizations
 
 
-@router.get("/organizations/{org_id}", response_model=Organization)
-async def get_organization_by_id(
+@router.get("/organizations/{org_id}", response_model=Organization, dependencies=[Depends(admit("lookup"))])
+def get_organization_by_id(
     org_id: int,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
@@ -82,8 +135,8 @@ async def get_organization_by_id(
     return organization
 
 
-@router.get("/organizations/search/by-name", response_model=List[Organization])
-async def search_organizations_by_name(
+@router.get("/organizations/search/by-name", response_model=List[Organization], dependencies=[Depends(admit("scan"))])
+def search_organizations_by_name(
     name: str = Query(..., description="Название для поиска"),
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
@@ -96,44 +149,47 @@ async def search_organizations_by_name(
 @router.get("/organizations/search/by-activity", response_model=List[Organization])
 async def search_organizations_by_activity(
     activity_name: str = Query(..., description="Название вида деятельности"),
-    api_key: str = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    api_key: str = Depends(verify_api_key)
 ):
     """Поиск организаций по виду деятельности (включая дочерние)"""
-    # Сначала найдем вид деятельности по названию
-    activity = db.query(Activity).filter(Activity.name.ilike(f"%{activity_name}%")).first()
-    if not activity:
-        return []
-    
-    # Получим все организации с этим видом деятельности и дочерними
-    organizations = OrganizationService.get_organizations_by_activity(db, activity.id)
-    return organizations
+    return await organizations_flight.do(
+        make_key("organizations_by_activity_name", activity_name=activity_name),
+        load_organizations, OrganizationService.search_organizations_by_activity, activity_name
+    )
 
 
-@router.post("/organizations", response_model=Organization)
-async def create_organization(
+@router.post("/organizations", response_model=Organization, dependencies=[Depends(admit("write"))])
+def create_organization(
     organization_data: OrganizationCreate,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
 ):
     """Создать новую организацию"""
-    organization = OrganizationService.create_organization(db, organization_data)
-    return organization
+    try:
+        organization = OrganizationService.create_organization(db, organization_data)
+        return organization
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # Эндпоинты для зданий
-@router.get("/buildings", response_model=List[Building])
-async def get_all_buildings(
+@router.get("/buildings", response_model=List[Building], dependencies=[Depends(admit("lookup"))])
+def get_all_buildings(
+    request: Request,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
 ):
     """Получить список всех зданий"""
-    buildings = BuildingService.get_all_buildings(db)
-    return buildings
+    return cached_json_response(
+        request, db, "buildings",
+        lambda: TypeAdapter(List[Building]).dump_json(
+            [Building.model_validate(b) for b in BuildingService.get_all_buildings(db)]
+        )
+    )
 
 
-@router.get("/buildings/{building_id}", response_model=Building)
-async def get_building_by_id(
+@router.get("/buildings/{building_id}", response_model=Building, dependencies=[Depends(admit("lookup"))])
+def get_building_by_id(
     building_id: int,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
@@ -145,8 +201,8 @@ async def get_building_by_id(
     return building
 
 
-@router.post("/buildings", response_model=Building)
-async def create_building(
+@router.post("/buildings", response_model=Building, dependencies=[Depends(admit("write"))])
+def create_building(
     building_data: BuildingCreate,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
@@ -157,18 +213,50 @@ async def create_building(
 
 
 # Эндпоинты для видов деятельности
-@router.get("/activities", response_model=List[Activity])
-async def get_all_activities(
+@router.get("/activities", response_model=List[Activity], dependencies=[Depends(admit("lookup"))])
+def get_all_activities(
+    request: Request,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
 ):
     """Получить список всех видов деятельности"""
-    activities = ActivityService.get_all_activities(db)
-    return activities
+    return cached_json_response(
+        request, db, "activities",
+        lambda: TypeAdapter(List[Activity]).dump_json(
+            [Activity.model_validate(a) for a in ActivityService.get_all_activities(db)]
+        )
+    )
+
+
+@router.get("/activities/facets", response_model=List[ActivityFacet], dependencies=[Depends(admit("scan"))])
+def get_activity_facets(
+    latitude: Optional[float] = Query(None, description="Широта центра"),
+    longitude: Optional[float] = Query(None, description="Долгота центра"),
+    radius_km: Optional[float] = Query(None, description="Радиус в километрах"),
+    min_lat: Optional[float] = Query(None, description="Минимальная широта"),
+    max_lat: Optional[float] = Query(None, description="Максимальная широта"),
+    min_lon: Optional[float] = Query(None, description="Минимальная долгота"),
+    max_lon: Optional[float] = Query(None, description="Максимальная долгота"),
+    api_key: str = Depends(verify_api_key),
+    db: Session = Depends(get_db)
+):
+    """Получить число организаций по каждому виду деятельности (включая дочерние)"""
+    radius_params = (latitude, longitude, radius_km)
+    rectangle_params = (min_lat, max_lat, min_lon, max_lon)
+    if any(p is not None for p in radius_params) and None in radius_params:
+        raise HTTPException(status_code=400, detail="Для радиуса нужны latitude, longitude и radius_km")
+    if any(p is not None for p in rectangle_params) and None in rectangle_params:
+        raise HTTPException(status_code=400, detail="Для прямоугольника нужны min_lat, max_lat, min_lon и max_lon")
+
+    return ActivityService.get_activity_facets(
+        db,
+        radius=radius_params if radius_km is not None else None,
+        rectangle=rectangle_params if min_lat is not None else None,
+    )
 
 
-@router.get("/activities/{activity_id}", response_model=Activity)
-async def get_activity_by_id(
+@router.get("/activities/{activity_id}", response_model=Activity, dependencies=[Depends(admit("lookup"))])
+def get_activity_by_id(
     activity_id: int,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
@@ -180,8 +268,8 @@ async def get_activity_by_id(
     return activity
 
 
-@router.post("/activities", response_model=Activity)
-async def create_activity(
+@router.post("/activities", response_model=Activity, dependencies=[Depends(admit("write"))])
+def create_activity(
     activity_data: ActivityCreate,
     api_key: str = Depends(verify_api_key),
     db: Session = Depends(get_db)
@@ -192,3 +280,121 @@ async def create_activity(
         return activity
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+# Автодополнение названий
+@router.get("/autocomplete", response_model=List[Suggestion])
+async def autocomplete(
+    q: str = Query(..., min_length=1, description="Начало названия"),
+    limit: int = Query(10, ge=1, le=50, description="Максимальное число подсказок"),
+    kind: Optional[str] = Query(None, pattern="^(organization|activity)$", description="Тип: organization или activity"),
+    api_key: str = Depends(verify_api_key)
+):
+    """Подсказки по началу названия организации или вида деятельности"""
+    if not autocomplete_index.loaded:
+        # Первая загрузка в воркере: читает все названия, как тяжёлая выборка
+        async with admission_controllers["scan"].slot():
+            await run_in_threadpool(autocomplete_index.ensure_loaded)
+    return autocomplete_index.search(q, limit, kind)
+
+
+# Полная выгрузка справочника. Зависимость admit завершается после отправки
+# тела ответа, поэтому место занято на всё время потоковой выгрузки.
+@router.get("/export", dependencies=[Depends(admit("export"))])
+async def export_organizations(
+    format: str = Query("csv", description="Формат: csv, ndjson, parquet или arrow"),
+    chunk_size: int = Query(1000, ge=100, le=50000, description="Размер порции чтения"),
+    api_key: str = Depends(verify_api_key)
+):
+    """Потоковая выгрузка организаций со зданиями, телефонами и видами деятельности"""
+    try:
+        chunks = export.export_organizations(format, chunk_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="organizations.{format}"'},
+    )
+
+
+# Служебная статистика
+@router.get("/admin/stats")
+async def get_stats(
+    admin_token: str = Depends(verify_admin_token)
+):
+    """Счётчики внутренних механизмов сервиса"""
+    return {
+        "coalescing": organizations_flight.stats(),
+        "admission": {name: c.stats() for name, c in admission_controllers.items()},
+        "invalidation": change_listener.stats(),
+        "api_keys": {"cached": len(api_key_cache)},
+    }
+
+
+# Лента изменений для инкрементальной синхронизации
+@router.get("/changes", response_model=ChangeFeed, dependencies=[Depends(admit("lookup"))])
+def get_changes(
+    since: str = Query("0-0", pattern=r"^\d+-\d+$", description="Курсор, полученный в предыдущем ответе"),
+    limit: int = Query(500, ge=1, le=5000, description="Максимальное число изменений в ответе"),
+    api_key: str = Depends(verify_api_key),
+    db: Session = Depends(get_db)
+):
+    """Получить здания, виды деятельности и организации, изменённые после курсора"""
+    return ChangeService.get_changes(db, since, limit)
+
+
+# Служебные эндпоинты профилирования
+@router.get("/admin/profiles")
+async def list_profiles(
+    admin_token: str = Depends(verify_admin_token)
+):
+    """Список сохранённых профилей запросов"""
+    return profiling.list_profiles()
+
+
+@router.get("/admin/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    admin_token: str = Depends(verify_admin_token)
+):
+    """Скачать профиль запроса"""
+    path = profiling.profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json")
+
+
+# Служебные эндпоинты API ключей
+@router.get("/admin/api-keys", response_model=List[ApiKeyInfo])
+def list_api_keys(
+    admin_token: str = Depends(verify_admin_token),
+    db: Session = Depends(get_db)
+):
+    """Список API ключей"""
+    return ApiKeyService.get_all_api_keys(db)
+
+
+@router.post("/admin/api-keys", response_model=ApiKeyCreated)
+def create_api_key(
+    key_data: ApiKeyCreate,
+    admin_token: str = Depends(verify_admin_token),
+    db: Session = Depends(get_db)
+):
+    """Создать API ключ. Значение ключа возвращается только в этом ответе"""
+    key = generate_key()
+    api_key = ApiKeyService.create_api_key(db, key_data, hash_key(key))
+    return ApiKeyCreated(**ApiKeyInfo.model_validate(api_key).model_dump(), key=key)
+
+
+@router.delete("/admin/api-keys/{key_id}", response_model=ApiKeyInfo)
+def deactivate_api_key(
+    key_id: int,
+    admin_token: str = Depends(verify_admin_token),
+    db: Session = Depends(get_db)
+):
+    """Отключить API ключ"""
+    api_key = ApiKeyService.deactivate_api_key(db, key_id)
+    if not api_key:
+        raise HTTPException(status_code=404, detail="API ключ не найден")
+    return api_key
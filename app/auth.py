@@ -0,0 +1,185 @@
+import hashlib
+import math
+import os
+import secrets
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from fastapi import Header, HTTPException, Query
+
+from app.database import SessionLocal
+from app.invalidation import register_invalidator
+from app.models import ApiKey
+from app.schemas import ApiKeyInfo
+
+# Сколько секунд ключ живёт в кэше воркера без обращения к базе
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "60"))
+# Неизвестные ключи кэшируются короче, чтобы новый ключ быстро заработал
+API_KEY_NEGATIVE_TTL = float(os.getenv("API_KEY_NEGATIVE_TTL", "5"))
+# Сколько ключей (известных и неизвестных) помнит кэш воркера
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+# Лимит обращений к базе за ключами, которых нет в кэше, на воркер
+API_KEY_MISS_RATE = float(os.getenv("API_KEY_MISS_RATE", "50"))
+API_KEY_MISS_BURST = int(os.getenv("API_KEY_MISS_BURST", "100"))
+
+
+def hash_key(key: str) -> str:
+    """SHA-256 ключа: в базе хранится только хэш"""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def generate_key() -> str:
+    """Новый случайный API ключ"""
+    return secrets.token_urlsafe(32)
+
+
+class ApiKeyCache:
+    """LRU-кэш проверенных ключей с TTL, ключ кэша - хэш API ключа.
+
+    Неизвестные ключи тоже кэшируются, поэтому размер ограничен: при
+    переполнении удаляются истёкшие записи, затем давно не использованные.
+    """
+
+    def __init__(self, max_entries: int = API_KEY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[ApiKeyInfo]]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key_hash: str) -> Tuple[bool, Optional[ApiKeyInfo]]:
+        """(найден ли в кэше, информация о ключе или None для неизвестного)"""
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None or entry[0] <= time.monotonic():
+                return False, None
+            self._entries.move_to_end(key_hash)
+            return True, entry[1]
+
+    def get_stale(self, key_hash: str) -> Optional[ApiKeyInfo]:
+        """Известный ключ, даже если срок записи истёк (None - ключа нет в кэше)"""
+        entry = self._entries.get(key_hash)
+        return entry[1] if entry is not None else None
+
+    def set(self, key_hash: str, info: Optional[ApiKeyInfo]) -> None:
+        ttl = API_KEY_CACHE_TTL if info is not None else API_KEY_NEGATIVE_TTL
+        with self._lock:
+            self._entries[key_hash] = (time.monotonic() + ttl, info)
+            self._entries.move_to_end(key_hash)
+            if len(self._entries) > self.max_entries:
+                now = time.monotonic()
+                for stale_hash in [h for h, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                    del self._entries[stale_hash]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, key_id: Optional[int] = None) -> None:
+        """Сбросить ключ с данным id (None - весь кэш)"""
+        with self._lock:
+            if key_id is None:
+                self._entries.clear()
+                return
+            for key_hash, (_, info) in list(self._entries.items()):
+                if info is None or info.id == key_id:
+                    del self._entries[key_hash]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше burst накопленных"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = Lock()
+
+    def take(self) -> float:
+        """Взять токен. Возвращает 0, если можно, иначе через сколько секунд повторить"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token bucket на каждый ключ. Лимит действует в пределах одного воркера."""
+
+    def __init__(self):
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._lock = Lock()
+
+    def check(self, info: ApiKeyInfo) -> float:
+        bucket = self._buckets.get(info.id)
+        if bucket is None or bucket.rate != info.rate_per_second or bucket.burst != info.burst:
+            with self._lock:
+                bucket = TokenBucket(info.rate_per_second, info.burst)
+                self._buckets[info.id] = bucket
+        return bucket.take()
+
+
+api_key_cache = ApiKeyCache()
+rate_limiter = RateLimiter()
+# Общий на воркер лимит промахов кэша: перебор случайных ключей не нагружает базу
+miss_limiter = TokenBucket(API_KEY_MISS_RATE, API_KEY_MISS_BURST)
+register_invalidator({"api_key"}, lambda change: api_key_cache.invalidate(change.get("id")))
+
+
+def lookup_api_key(key: str) -> Optional[ApiKeyInfo]:
+    """Найти активный ключ: сначала в кэше, при промахе - в базе"""
+    key_hash = hash_key(key)
+    found, info = api_key_cache.get(key_hash)
+    if found:
+        return info
+
+    retry_after = miss_limiter.take()
+    if retry_after > 0:
+        # Известные ключи продолжают работать по устаревшей записи, пока лимит исчерпан
+        info = api_key_cache.get_stale(key_hash)
+        if info is not None:
+            return info
+        raise HTTPException(
+            status_code=429,
+            detail="Превышен лимит проверки API ключей",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    db = SessionLocal()
+    try:
+        api_key = db.query(ApiKey).filter(ApiKey.key_hash == key_hash, ApiKey.is_active.is_(True)).first()
+        info = ApiKeyInfo.model_validate(api_key) if api_key else None
+    finally:
+        db.close()
+
+    api_key_cache.set(key_hash, info)
+    return info
+
+
+def verify_api_key(
+    x_api_key: Optional[str] = Header(None, description="API ключ"),
+    api_key: Optional[str] = Query(None, description="API ключ (устарело, используйте заголовок X-API-Key)", deprecated=True),
+):
+    """Проверка API ключа и лимита запросов для него"""
+    key = x_api_key or api_key
+    if not key:
+        raise HTTPException(status_code=401, detail="Не указан API ключ")
+
+    info = lookup_api_key(key)
+    if info is None:
+        raise HTTPException(status_code=401, detail="Неверный API ключ")
+
+    retry_after = rate_limiter.check(info)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Превышен лимит запросов",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    return info.name
@@ -0,0 +1,155 @@
+import bisect
+import logging
+from threading import Lock, Thread
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.invalidation import register_invalidator
+from app.models import Organization, Activity
+from app.schemas import Suggestion
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    """Привести строку к виду для поиска: регистр, ё -> е, лишние пробелы"""
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+class PrefixIndex:
+    """Индекс подсказок по префиксу на отсортированном массиве.
+
+    Каждое название индексируется с начала каждого слова, поэтому запрос
+    "копыт" находит "ООО Рога и Копыта". Поиск - бинарный поиск по массиву
+    и последовательный просмотр совпадений до набора limit подсказок.
+
+    После загрузки индекс не обращается к базе при поиске: перестроение
+    (после потери уведомлений) идёт в фоновом потоке, а до его окончания
+    подсказки отдаются из прежнего индекса.
+    """
+
+    def __init__(self):
+        # Элементы: (нормализованный ключ, позиция слова, тип, id, название)
+        self._keys: List[Tuple[str, int, str, int, str]] = []
+        self._lock = Lock()
+        self._load_lock = Lock()
+        self.loaded = False
+        self._rebuilding = False
+        self._rebuild_pending = False
+
+    @staticmethod
+    def _entries(kind: str, entity_id: int, name: str) -> Iterable[Tuple[str, int, str, int, str]]:
+        words = normalize(name).split(" ")
+        for position in range(len(words)):
+            yield (" ".join(words[position:]), position, kind, entity_id, name)
+
+    def build(self, items: Iterable[Tuple[str, int, str]]) -> None:
+        """Построить индекс заново из троек (тип, id, название)"""
+        keys = sorted(
+            entry
+            for kind, entity_id, name in items
+            for entry in self._entries(kind, entity_id, name)
+        )
+        with self._lock:
+            self._keys = keys
+            self.loaded = True
+
+    def load(self, db: Session) -> None:
+        """Построить индекс по организациям и видам деятельности из базы"""
+        organizations = db.query(Organization.id, Organization.name).all()
+        activities = db.query(Activity.id, Activity.name).all()
+        self.build(
+            [("organization", org_id, name) for org_id, name in organizations] +
+            [("activity", activity_id, name) for activity_id, name in activities]
+        )
+
+    def _load_from_database(self) -> None:
+        db = SessionLocal()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+
+    def ensure_loaded(self) -> None:
+        """Загрузить индекс, если он ещё не загружен (один раз на воркер)"""
+        with self._load_lock:
+            if not self.loaded:
+                self._load_from_database()
+
+    def add(self, kind: str, entity_id: int, name: str) -> None:
+        """Добавить название в уже построенный индекс"""
+        if not self.loaded:
+            return
+        with self._lock:
+            if self._rebuilding:
+                # Перестроение могло прочитать базу до этой записи
+                self._rebuild_pending = True
+            for entry in self._entries(kind, entity_id, name):
+                index = bisect.bisect_left(self._keys, entry)
+                # Воркер получает и собственные уведомления, запись может уже быть в индексе
+                if index < len(self._keys) and self._keys[index] == entry:
+                    continue
+                self._keys.insert(index, entry)
+
+    def invalidate(self) -> None:
+        """Перестроить индекс в фоне, продолжая отвечать по текущему"""
+        if not self.loaded:
+            return
+        with self._lock:
+            if self._rebuilding:
+                self._rebuild_pending = True
+                return
+            self._rebuilding = True
+        Thread(target=self._rebuild, name="autocomplete-rebuild", daemon=True).start()
+
+    def _rebuild(self) -> None:
+        while True:
+            with self._lock:
+                self._rebuild_pending = False
+            try:
+                self._load_from_database()
+            except Exception:
+                logger.exception("Не удалось перестроить индекс подсказок")
+            with self._lock:
+                if not self._rebuild_pending:
+                    self._rebuilding = False
+                    return
+
+    def search(self, query: str, limit: int = 10, kind: Optional[str] = None) -> List[Suggestion]:
+        """Найти до limit подсказок, начинающихся с query"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        seen = set()
+        suggestions = []
+        with self._lock:
+            keys = self._keys
+            index = bisect.bisect_left(keys, (prefix,))
+            while index < len(keys) and len(suggestions) < limit:
+                key, _, entry_kind, entity_id, name = keys[index]
+                if not key.startswith(prefix):
+                    break
+                index += 1
+                if kind is not None and entry_kind != kind:
+                    continue
+                if (entry_kind, entity_id) in seen:
+                    continue
+                seen.add((entry_kind, entity_id))
+                suggestions.append(Suggestion(kind=entry_kind, id=entity_id, name=name))
+        return suggestions
+
+
+autocomplete_index = PrefixIndex()
+
+
+def _apply_change(change: dict) -> None:
+    if change.get("entity") is not None and change.get("name"):
+        autocomplete_index.add(change["entity"], change["id"], change["name"])
+    else:
+        autocomplete_index.invalidate()
+
+
+register_invalidator({"organization", "activity"}, _apply_change)
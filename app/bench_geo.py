@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк гео-запросов и выборок по ключу по секционированной модели чтения
+на синтетических городах.
+
+Данные вставляются в одной транзакции, которая в конце откатывается,
+поэтому скрипт можно запускать на рабочей базе разработчика.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import insert, text, and_, func
+
+from app.database import SessionLocal
+from app.geo import geo_cell
+from app.models import Building, Organization, OrganizationRead
+from app.services import OrganizationService, rectangle_condition
+
+
+def create_cities(db, rng, cities: int, buildings_per_city: int, orgs_per_building: int):
+    """Вставить синтетические города и вернуть их центры"""
+    centers = []
+    for city in range(cities):
+        lat, lon = rng.uniform(42, 68), rng.uniform(20, 150)
+        centers.append((lat, lon))
+
+        buildings = []
+        for number in range(buildings_per_city):
+            b_lat = lat + rng.gauss(0, 0.08)
+            b_lon = lon + rng.gauss(0, 0.12)
+            buildings.append({
+                "address": f"Город {city}, дом {number}",
+                "latitude": b_lat,
+                "longitude": b_lon,
+                "geo_cell": geo_cell(b_lat, b_lon),
+            })
+        building_rows = db.execute(
+            insert(Building).returning(Building.id, Building.address, Building.latitude,
+                                       Building.longitude, Building.geo_cell),
+            buildings,
+        ).all()
+
+        organizations = [
+            {"name": f"Организация {city}-{row.id}-{n}", "building_id": row.id}
+            for row in building_rows for n in range(orgs_per_building)
+        ]
+        organization_rows = db.execute(
+            insert(Organization).returning(Organization.id, Organization.name, Organization.building_id),
+            organizations,
+        ).all()
+
+        by_id = {row.id: row for row in building_rows}
+        db.execute(insert(OrganizationRead), [
+            {
+                "organization_id": org.id,
+                "geo_cell": by_id[org.building_id].geo_cell,
+                "name": org.name,
+                "building_id": org.building_id,
+                "address": by_id[org.building_id].address,
+                "latitude": by_id[org.building_id].latitude,
+                "longitude": by_id[org.building_id].longitude,
+                "phones": [],
+                "activity_ids": [],
+                "activity_ancestor_ids": [],
+            }
+            for org in organization_rows
+        ])
+        print(f"   • Город {city + 1}/{cities}: {len(organization_rows)} организаций")
+    return centers
+
+
+def measure(fn, iterations: int) -> float:
+    """Медиана времени выполнения fn в миллисекундах"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def scanned_partitions(db, query) -> int:
+    """Число секций organization_read, которые запрос действительно читает.
+
+    Секции, отсечённые во время выполнения (ячейка из подзапроса), остаются
+    в плане с пометкой "never executed" и не считаются.
+    """
+    compiled = query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True})
+    plan = db.execute(text(f"EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF) {compiled}")).scalars().all()
+    return sum(
+        1 for line in plan
+        if "on organization_read_" in line and "Bitmap Index Scan" not in line and "never executed" not in line
+    )
+
+
+def run_benchmark(cities: int, buildings_per_city: int, orgs_per_building: int,
+                  iterations: int, radius_km: float, seed: int):
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        print(f"🌱 Создание {cities} синтетических городов...")
+        centers = create_cities(db, rng, cities, buildings_per_city, orgs_per_building)
+        db.execute(text("ANALYZE buildings"))
+        db.execute(text("ANALYZE organizations"))
+        db.execute(text("ANALYZE organization_read"))
+
+        points = [(lat + rng.gauss(0, 0.05), lon + rng.gauss(0, 0.05)) for lat, lon in centers]
+        delta = 0.05
+
+        def partitioned_radius():
+            for lat, lon in points:
+                OrganizationService.get_organizations_in_radius(db, lat, lon, radius_km)
+
+        def partitioned_rectangle():
+            for lat, lon in points:
+                OrganizationService.get_organizations_in_rectangle(db, lat - delta, lat + delta, lon - delta, lon + delta)
+
+        def unpruned_rectangle():
+            # Та же модель чтения без условия по geo_cell: сканируются все секции
+            for lat, lon in points:
+                db.query(OrganizationRead).filter(and_(
+                    OrganizationRead.latitude.between(lat - delta, lat + delta),
+                    OrganizationRead.longitude.between(lon - delta, lon + delta),
+                )).all()
+
+        def joined_rectangle():
+            # Прежний способ: соединение organizations и buildings
+            for lat, lon in points:
+                db.query(Organization.id).join(Building).filter(and_(
+                    Building.latitude.between(lat - delta, lat + delta),
+                    Building.longitude.between(lon - delta, lon + delta),
+                )).all()
+
+        organization_ids = [row.organization_id for row in db.query(OrganizationRead.organization_id)
+                            .order_by(func.random()).limit(len(points))]
+        building_ids = [row.building_id for row in db.query(OrganizationRead.building_id)
+                        .order_by(func.random()).limit(len(points))]
+
+        def organization_cell(org_id):
+            return db.query(Building.geo_cell).join(
+                Organization, Organization.building_id == Building.id
+            ).filter(Organization.id == org_id)
+
+        def building_cell(building_id):
+            return db.query(Building.geo_cell).filter(Building.id == building_id)
+
+        def by_id_one_query():
+            # Как OrganizationService.get_organization_by_id: индекс первичного ключа каждой секции
+            for org_id in organization_ids:
+                db.query(OrganizationRead).filter(OrganizationRead.organization_id == org_id).all()
+
+        def by_id_cell_first():
+            # Ячейка отдельным запросом, затем одна секция
+            for org_id in organization_ids:
+                cell = organization_cell(org_id).scalar()
+                db.query(OrganizationRead).filter(
+                    OrganizationRead.organization_id == org_id, OrganizationRead.geo_cell == cell
+                ).all()
+
+        def by_id_cell_subquery():
+            # Ячейка подзапросом: секции отсекаются во время выполнения
+            for org_id in organization_ids:
+                db.query(OrganizationRead).filter(
+                    OrganizationRead.organization_id == org_id,
+                    OrganizationRead.geo_cell == organization_cell(org_id).scalar_subquery(),
+                ).all()
+
+        def by_building_cell_first():
+            # Как OrganizationService.get_organizations_by_building
+            for building_id in building_ids:
+                cell = building_cell(building_id).scalar()
+                db.query(OrganizationRead).filter(
+                    OrganizationRead.building_id == building_id, OrganizationRead.geo_cell == cell
+                ).all()
+
+        def by_building_one_query():
+            for building_id in building_ids:
+                db.query(OrganizationRead).filter(OrganizationRead.building_id == building_id).all()
+
+        def by_building_cell_subquery():
+            for building_id in building_ids:
+                db.query(OrganizationRead).filter(
+                    OrganizationRead.building_id == building_id,
+                    OrganizationRead.geo_cell == building_cell(building_id).scalar_subquery(),
+                ).all()
+
+        def by_activity():
+            # Не гео-выборка: GIN-индекс каждой секции
+            for activity_id in range(1, len(points) + 1):
+                OrganizationService.get_organizations_by_activity(db, activity_id)
+
+        lat, lon = points[0]
+        pruned_query = db.query(OrganizationRead).filter(rectangle_condition(
+            lat - delta, lat + delta, lon - delta, lon + delta,
+            OrganizationRead.latitude, OrganizationRead.longitude, OrganizationRead.geo_cell
+        ))
+        unpruned_query = db.query(OrganizationRead).filter(
+            OrganizationRead.latitude.between(lat - delta, lat + delta),
+            OrganizationRead.longitude.between(lon - delta, lon + delta),
+        )
+
+        by_id_query = db.query(OrganizationRead).filter(OrganizationRead.organization_id == organization_ids[0])
+        by_id_subquery = db.query(OrganizationRead).filter(
+            OrganizationRead.organization_id == organization_ids[0],
+            OrganizationRead.geo_cell == organization_cell(organization_ids[0]).scalar_subquery(),
+        )
+        by_building_query = db.query(OrganizationRead).filter(
+            OrganizationRead.building_id == building_ids[0],
+            OrganizationRead.geo_cell == building_cell(building_ids[0]).scalar(),
+        )
+        activity_query = db.query(OrganizationRead).filter(OrganizationRead.activity_ancestor_ids.contains([1]))
+
+        total = db.query(func.count()).select_from(OrganizationRead).scalar()
+        print(f"📊 Организаций в модели чтения: {total}, запросов на замер: {len(points)}")
+        print(f"   • Секций в плане: с geo_cell - {scanned_partitions(db, pruned_query)}, "
+              f"без - {scanned_partitions(db, unpruned_query)}")
+        print(f"   • Радиус {radius_km} км (секции + ячейки):  {measure(partitioned_radius, iterations):.1f} мс")
+        print(f"   • Прямоугольник (секции + ячейки):    {measure(partitioned_rectangle, iterations):.1f} мс")
+        print(f"   • Прямоугольник без geo_cell:         {measure(unpruned_rectangle, iterations):.1f} мс")
+        print(f"   • Прямоугольник, organizations+buildings: {measure(joined_rectangle, iterations):.1f} мс")
+        print(f"   • Секций в плане: по id - {scanned_partitions(db, by_id_query)}, "
+              f"по id с ячейкой подзапросом - {scanned_partitions(db, by_id_subquery)}, "
+              f"по зданию - {scanned_partitions(db, by_building_query)}, "
+              f"по виду деятельности - {scanned_partitions(db, activity_query)}")
+        print(f"   • По id одним запросом:               {measure(by_id_one_query, iterations):.1f} мс")
+        print(f"   • По id, сначала ячейка:              {measure(by_id_cell_first, iterations):.1f} мс")
+        print(f"   • По id, ячейка подзапросом:          {measure(by_id_cell_subquery, iterations):.1f} мс")
+        print(f"   • По зданию, сначала ячейка:          {measure(by_building_cell_first, iterations):.1f} мс")
+        print(f"   • По зданию без geo_cell:             {measure(by_building_one_query, iterations):.1f} мс")
+        print(f"   • По зданию, ячейка подзапросом:      {measure(by_building_cell_subquery, iterations):.1f} мс")
+        print(f"   • По виду деятельности (все секции):  {measure(by_activity, iterations):.1f} мс")
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк гео-запросов на синтетических городах")
+    parser.add_argument("--cities", type=int, default=50, help="Число городов")
+    parser.add_argument("--buildings-per-city", type=int, default=400, help="Зданий в городе")
+    parser.add_argument("--orgs-per-building", type=int, default=2, help="Организаций в здании")
+    parser.add_argument("--iterations", type=int, default=5, help="Повторов каждого замера")
+    parser.add_argument("--radius-km", type=float, default=3.0, help="Радиус поиска")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора")
+    args = parser.parse_args()
+
+    run_benchmark(args.cities, args.buildings_per_city, args.orgs_per_building,
+                  args.iterations, args.radius_km, args.seed)
+
+
+if __name__ == "__main__":
+    main()
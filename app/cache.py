@@ -0,0 +1,39 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, Optional
+
+
+class VersionedCache:
+    """LRU-кэш значений, привязанных к версии данных.
+
+    Значение возвращается только если оно было посчитано для той же версии
+    данных, что и текущая, поэтому любая запись в справочник делает кэш
+    неактуальным без явной инвалидации.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """Получить значение для ключа, если оно посчитано для версии version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, version: int, value: Any) -> None:
+        """Сохранить значение для ключа и версии данных"""
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        with self._lock:
+            self._entries.clear()
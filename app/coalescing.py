@@ -0,0 +1,101 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.profiling import profiled
+
+
+def make_key(endpoint: str, **params: Any) -> Tuple:
+    """Нормализованный ключ запроса: имя эндпоинта и отсортированные параметры"""
+    normalized = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, float):
+            value = round(value, 6)
+        elif isinstance(value, str):
+            value = value.strip().casefold()
+        normalized.append((name, value))
+    return (endpoint, tuple(normalized))
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов.
+
+    Первый запрос с данным ключом запускает вычисление в пуле потоков,
+    остальные ждут тот же результат. При ttl > 0 результат ещё ttl секунд
+    отдаётся из памяти без повторного вычисления. Если задан admission,
+    место в контроллере нагрузки занимает только само вычисление, а не
+    каждый ожидающий запрос.
+    """
+
+    def __init__(self, ttl: float = 0.0, max_entries: int = 1024, admission: Optional[Any] = None):
+        self.ttl = ttl
+        self.admission = admission
+        self.max_entries = max_entries
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """Получить результат fn(*args), разделяя его между запросами с ключом key"""
+        self.calls += 1
+
+        cached = self._results.get(key)
+        if cached is not None:
+            expires_at, value = cached
+            if expires_at > time.monotonic():
+                self.cache_hits += 1
+                return value
+            del self._results[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._execute(key, fn, args))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+
+        # shield: отмена одного клиента не должна отменять общее вычисление
+        return await asyncio.shield(task)
+
+    async def _execute(self, key: Hashable, fn: Callable[..., Any], args: Tuple) -> Any:
+        slot = self.admission.slot() if self.admission is not None else nullcontext()
+        try:
+            async with slot:
+                self.executions += 1
+                value = await run_in_threadpool(profiled(fn), *args)
+        finally:
+            del self._inflight[key]
+
+        if self.ttl > 0:
+            self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        if len(self._results) >= self.max_entries:
+            for stale_key in [k for k, (expires_at, _) in self._results.items() if expires_at <= now]:
+                del self._results[stale_key]
+            if len(self._results) >= self.max_entries:
+                self._results.pop(next(iter(self._results)))
+        self._results[key] = (now + self.ttl, value)
+
+    def clear(self) -> None:
+        """Сбросить кэш результатов"""
+        self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики объединения запросов"""
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "in_flight": len(self._inflight),
+            "cached": len(self._results),
+        }
@@ -0,0 +1,158 @@
+import gzip
+import os
+from typing import Callable, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.cache import VersionedCache
+from app.invalidation import register_invalidator
+from app.services import ChangeService
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+# Ответы меньше этого размера (в байтах) не сжимаются
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson")
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Выбрать кодировку ответа по заголовку Accept-Encoding.
+
+    Побеждает кодировка с наибольшим q (явным или от "*"); при равных q
+    br предпочитается gzip, а сжатие - identity. identity участвует в выборе,
+    только если указана явно.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, *params = part.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = "identity", accepted.get("identity", 0.0)
+    # Обход от менее предпочтительной к более: при равных q побеждает последняя
+    for encoding in reversed(candidates):
+        quality = accepted.get(encoding, wildcard)
+        if quality > 0 and quality >= best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжать тело ответа в заданной кодировке"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+class CompressionMiddleware:
+    """Сжатие gzip/brotli для ответов, переданных одним куском.
+
+    Потоковые ответы (выгрузка) и ответы, уже имеющие Content-Encoding,
+    передаются без изменений.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            if (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+
+            await send(start_message)
+            start_message = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+# Готовые (сериализованные и сжатые) тела ответов, ключ - (эндпоинт, кодировка)
+payload_cache = VersionedCache(max_entries=64)
+register_invalidator({"building", "activity"}, lambda change: payload_cache.clear())
+
+
+def get_cached_payload(key: str, version: int, encoding: str, build: Callable[[], bytes]) -> Tuple[bytes, str]:
+    """Тело ответа для версии данных: из кэша или построенное и сжатое один раз"""
+    cached = payload_cache.get((key, encoding), version)
+    if cached is not None:
+        return cached
+
+    raw = payload_cache.get((key, "identity"), version)
+    if raw is None:
+        raw = (build(), "identity")
+        payload_cache.set((key, "identity"), version, raw)
+
+    body = raw[0]
+    if encoding == "identity" or len(body) < COMPRESSION_MIN_SIZE:
+        payload = raw
+    else:
+        payload = (compress(body, encoding), encoding)
+    payload_cache.set((key, encoding), version, payload)
+    return payload
+
+
+def cached_json_response(request: Request, db: Session, key: str, build: Callable[[], bytes]) -> Response:
+    """JSON-ответ, который сериализуется и сжимается один раз на версию данных"""
+    version = ChangeService.get_data_version(db)
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    body, body_encoding = get_cached_payload(key, version, encoding, build)
+
+    headers = {"Vary": "Accept-Encoding"}
+    if body_encoding != "identity":
+        headers["Content-Encoding"] = body_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
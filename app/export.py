@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Выгрузка всего справочника организаций в CSV, NDJSON, Parquet или Arrow
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from typing import Dict, Iterator, List
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, select, func
+
+from app.database import DATABASE_URL, EXPORT_MAX_CONNECTIONS
+from app.models import Organization, Building, Activity, Phone, organization_phone, organization_activity
+
+EXPORT_FORMATS = ("csv", "ndjson", "parquet", "arrow")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+COLUMNS = [
+    "organization_id", "organization_name", "building_id", "address",
+    "latitude", "longitude", "phones", "activity_ids", "activity_paths",
+]
+
+_export_engine = None
+
+
+def get_export_engine():
+    """Движок выгрузки, создаётся при первой выгрузке.
+
+    Отдельный маленький пул: выгрузка не занимает соединения основного пула
+    и не открывает больше EXPORT_MAX_CONNECTIONS соединений.
+    """
+    global _export_engine
+    if _export_engine is None:
+        _export_engine = create_engine(DATABASE_URL, pool_size=EXPORT_MAX_CONNECTIONS, max_overflow=0)
+    return _export_engine
+
+
+def get_activity_paths(conn) -> Dict[int, str]:
+    """Пути видов деятельности вида "Еда / Мясная продукция" """
+    rows = conn.execute(select(Activity.id, Activity.name, Activity.parent_id)).all()
+    by_id = {row.id: row for row in rows}
+
+    paths = {}
+    for row in rows:
+        names = []
+        current = row
+        while current is not None:
+            names.append(current.name)
+            current = by_id.get(current.parent_id)
+        paths[row.id] = " / ".join(reversed(names))
+    return paths
+
+
+def export_query():
+    """Запрос организаций со зданием, телефонами и id видов деятельности"""
+    phones = select(func.array_agg(Phone.number)).select_from(
+        organization_phone.join(Phone, Phone.id == organization_phone.c.phone_id)
+    ).where(organization_phone.c.organization_id == Organization.id).scalar_subquery()
+
+    activity_ids = select(func.array_agg(organization_activity.c.activity_id)).where(
+        organization_activity.c.organization_id == Organization.id
+    ).scalar_subquery()
+
+    return select(
+        Organization.id.label("organization_id"),
+        Organization.name.label("organization_name"),
+        Building.id.label("building_id"),
+        Building.address,
+        Building.latitude,
+        Building.longitude,
+        phones.label("phones"),
+        activity_ids.label("activity_ids"),
+    ).join_from(Organization, Building, Building.id == Organization.building_id).order_by(Organization.id)
+
+
+def iter_export_batches(chunk_size: int = 1000) -> Iterator[List[dict]]:
+    """Читать организации со зданиями, телефонами и видами деятельности порциями.
+
+    Чтение идёт через серверный курсор в одной read-only транзакции, поэтому
+    вся выгрузка - один проход по данным с ограниченным расходом памяти.
+    """
+    query = export_query()
+
+    with get_export_engine().connect().execution_options(
+        isolation_level="REPEATABLE READ", postgresql_readonly=True
+    ) as conn:
+        paths = get_activity_paths(conn)
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for partition in result.mappings().partitions(chunk_size):
+            batch = []
+            for row in partition:
+                record = dict(row)
+                record["phones"] = sorted(record["phones"] or [])
+                record["activity_ids"] = sorted(record["activity_ids"] or [])
+                record["activity_paths"] = [paths[i] for i in record["activity_ids"] if i in paths]
+                batch.append(record)
+            yield batch
+
+
+def iter_csv(batches: Iterator[List[dict]]) -> Iterator[bytes]:
+    """CSV, списки разделены точкой с запятой"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for batch in batches:
+        for record in batch:
+            writer.writerow({
+                **record,
+                "phones": ";".join(record["phones"]),
+                "activity_ids": ";".join(str(i) for i in record["activity_ids"]),
+                "activity_paths": ";".join(record["activity_paths"]),
+            })
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_ndjson(batches: Iterator[List[dict]]) -> Iterator[bytes]:
+    """Один JSON-объект на строку"""
+    for batch in batches:
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файлоподобный приёмник, из которого можно забирать записанные байты"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_arrow(batches: Iterator[List[dict]], file_format: str) -> Iterator[bytes]:
+    """Parquet или Arrow IPC stream, по одному record batch на порцию"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("organization_id", pa.int64()),
+        ("organization_name", pa.string()),
+        ("building_id", pa.int64()),
+        ("address", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("phones", pa.list_(pa.string())),
+        ("activity_ids", pa.list_(pa.int64())),
+        ("activity_paths", pa.list_(pa.string())),
+    ])
+
+    sink = _ChunkSink()
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for batch in batches:
+        writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def check_export_format(file_format: str) -> None:
+    """Проверить, что формат поддерживается и его зависимости установлены"""
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {file_format}")
+    if file_format in ("parquet", "arrow"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError(f"Для формата {file_format} нужен пакет pyarrow")
+
+
+def export_organizations(file_format: str = "csv", chunk_size: int = 1000) -> Iterator[bytes]:
+    """Потоковая выгрузка организаций в заданном формате"""
+    check_export_format(file_format)
+    batches = iter_export_batches(chunk_size)
+    if file_format == "csv":
+        return iter_csv(batches)
+    if file_format == "ndjson":
+        return iter_ndjson(batches)
+    return iter_arrow(batches, file_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка справочника организаций")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Формат выгрузки")
+    parser.add_argument("--output", default="-", help="Файл для записи (по умолчанию stdout)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Размер порции чтения")
+    args = parser.parse_args()
+
+    try:
+        chunks = export_organizations(args.format, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
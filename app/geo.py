@@ -0,0 +1,76 @@
+import math
+from typing import List, Tuple
+
+# Размер географической ячейки в градусах
+CELL_SIZE_DEGREES = 1.0
+# Ширина полосы широт, образующей одну секцию organization_read
+PARTITION_BAND_DEGREES = 5
+# Больше ячеек в IN (...) не перечисляем - фильтруем диапазоном полос широт
+MAX_COVERING_CELLS = 64
+
+CELLS_PER_ROW = int(360 / CELL_SIZE_DEGREES)
+CELL_ROWS = int(180 / CELL_SIZE_DEGREES)
+
+
+def _row(latitude: float) -> int:
+    return min(CELL_ROWS - 1, max(0, int(math.floor((latitude + 90) / CELL_SIZE_DEGREES))))
+
+
+def _column(longitude: float) -> int:
+    return min(CELLS_PER_ROW - 1, max(0, int(math.floor((longitude + 180) / CELL_SIZE_DEGREES))))
+
+
+def geo_cell(latitude: float, longitude: float) -> int:
+    """Номер ячейки сетки, в которую попадает точка.
+
+    Ячейки нумеруются построчно с юга на север, поэтому полоса широт -
+    непрерывный диапазон номеров, по которому секционирована таблица.
+    """
+    return _row(latitude) * CELLS_PER_ROW + _column(longitude)
+
+
+def _wrap_longitude(longitude: float) -> float:
+    return longitude if -180 <= longitude <= 180 else (longitude + 180) % 360 - 180
+
+
+def longitude_ranges(min_lon: float, max_lon: float) -> List[Tuple[float, float]]:
+    """Диапазоны долгот [от, до] в пределах [-180, 180] для полосы min_lon..max_lon.
+
+    Полоса, пересекающая антимеридиан (например 179.8..180.2 или 179.8..-179.8,
+    когда min_lon > max_lon), разбивается на два диапазона.
+    """
+    if min_lon <= max_lon and max_lon - min_lon >= 360:
+        return [(-180.0, 180.0)]
+    min_lon, max_lon = _wrap_longitude(min_lon), _wrap_longitude(max_lon)
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+def covering_cells(min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> List[int]:
+    """Ячейки, покрывающие прямоугольник (пустой список - слишком много ячеек)"""
+    rows = range(_row(min_lat), _row(max_lat) + 1)
+    columns = [
+        column
+        for west, east in longitude_ranges(min_lon, max_lon)
+        for column in range(_column(west), _column(east) + 1)
+    ]
+    if len(rows) * len(columns) > MAX_COVERING_CELLS:
+        return []
+    return [row * CELLS_PER_ROW + column for row in rows for column in columns]
+
+
+def cell_range(min_lat: float, max_lat: float) -> Tuple[int, int]:
+    """Диапазон номеров ячеек для полосы широт [min_lat, max_lat]"""
+    return _row(min_lat) * CELLS_PER_ROW, (_row(max_lat) + 1) * CELLS_PER_ROW - 1
+
+
+def partition_bounds() -> List[Tuple[str, int, int]]:
+    """Секции organization_read: (суффикс имени, начало, конец) диапазона ячеек"""
+    rows_per_band = int(PARTITION_BAND_DEGREES / CELL_SIZE_DEGREES)
+    bounds = []
+    for first_row in range(0, CELL_ROWS, rows_per_band):
+        south = int(first_row * CELL_SIZE_DEGREES - 90)
+        suffix = f"s{-south}" if south < 0 else f"n{south}"
+        bounds.append((suffix, first_row * CELLS_PER_ROW, (first_row + rows_per_band) * CELLS_PER_ROW))
+    return bounds
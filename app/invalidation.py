@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Канал PostgreSQL для уведомлений об изменениях справочника
+CHANNEL = "orgatlas_changes"
+# Пауза перед переподключением слушателя после обрыва соединения
+RECONNECT_DELAY_SECONDS = 1.0
+
+# Обработчики: (типы сущностей, функция), функция получает словарь изменения
+_invalidators: List[Tuple[frozenset, Callable[[dict], None]]] = []
+
+
+def register_invalidator(entities: Iterable[str], handler: Callable[[dict], None]) -> None:
+    """Зарегистрировать сброс локального кэша при изменении сущностей заданных типов.
+
+    handler получает словарь {"entity", "id", ...}. При потере соединения
+    слушателя handler вызывается с entity=None - нужно сбросить всё.
+    """
+    _invalidators.append((frozenset(entities), handler))
+
+
+def dispatch(change: dict) -> None:
+    """Вызвать обработчики для изменения (entity=None - для всех)"""
+    entity = change.get("entity")
+    for entities, handler in _invalidators:
+        if entity is None or entity in entities:
+            try:
+                handler(change)
+            except Exception:
+                logger.exception("Ошибка инвалидации кэша для %s", change)
+
+
+def notify_change(db: Session, entity: str, entity_id: int, **fields) -> None:
+    """Отправить уведомление об изменении в текущей транзакции.
+
+    PostgreSQL доставляет NOTIFY только после фиксации транзакции, поэтому
+    воркеры не увидят изменение раньше, чем оно станет видно в базе.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    payload = json.dumps({"entity": entity, "id": entity_id, **fields}, ensure_ascii=False)
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+
+
+class ChangeListener:
+    """Фоновая задача воркера: LISTEN на канале и сброс локальных кэшей.
+
+    Соединение открывается с TCP keepalive, поэтому обрыв обнаруживается за
+    несколько секунд. После каждого (пере)подключения сбрасываются все кэши:
+    уведомления, пришедшие во время обрыва, потеряны.
+    """
+
+    def __init__(self, database_url: str = DATABASE_URL, channel: str = CHANNEL):
+        url = make_url(database_url)
+        self.backend = url.get_backend_name()
+        self.dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.connected = False
+        self.received = 0
+        self.reconnects = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn, keepalives=1, keepalives_idle=5, keepalives_interval=2, keepalives_count=2)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _on_readable(self, conn, lost: asyncio.Event) -> None:
+        try:
+            conn.poll()
+        except Exception:
+            lost.set()
+            return
+        while conn.notifies:
+            notification = conn.notifies.pop(0)
+            self.received += 1
+            try:
+                change = json.loads(notification.payload)
+            except ValueError:
+                change = {"entity": None}
+            dispatch(change)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                conn = await loop.run_in_executor(None, self._connect)
+            except Exception:
+                logger.warning("Не удалось подключиться для LISTEN %s", self.channel, exc_info=True)
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+
+            self.connected = True
+            dispatch({"entity": None})
+            lost = asyncio.Event()
+            loop.add_reader(conn.fileno(), self._on_readable, conn, lost)
+            try:
+                await lost.wait()
+            finally:
+                loop.remove_reader(conn.fileno())
+                self.connected = False
+                conn.close()
+
+            self.reconnects += 1
+            logger.warning("Соединение LISTEN %s потеряно, переподключение", self.channel)
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    def start(self) -> None:
+        """Запустить слушателя в текущем цикле событий"""
+        if self.backend != "postgresql" or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """Остановить слушателя"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        """Состояние слушателя"""
+        return {"connected": self.connected, "received": self.received, "reconnects": self.reconnects}
+
+
+change_listener = ChangeListener()
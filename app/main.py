@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from app.database import engine
 from app import models
 from app.api import router as api_router
+from app.compression import CompressionMiddleware
+from app.invalidation import change_listener
+from app.profiling import ProfilingMiddleware
 
 # Создаем таблицы в базе данных
 models.Base.metadata.create_all(bind=engine)
@@ -12,5 +15,22 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Сжатие gzip/brotli по Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Профилирование отдельных запросов по заголовку X-Profile или по выборке
+app.add_middleware(ProfilingMiddleware)
+
 # Подключаем API роуты
 app.include_router(api_router, prefix="/api/v1")
+
+
+@app.on_event("startup")
+async def start_change_listener():
+    """Слушать уведомления об изменениях для сброса локальных кэшей воркера"""
+    change_listener.start()
+
+
+@app.on_event("shutdown")
+async def stop_change_listener():
+    await change_listener.stop()
@@ -1,6 +1,43 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Boolean, DateTime, ForeignKey, Index, Table, Sequence, DDL, event, func, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.geo import geo_cell, partition_bounds
+from app.phones import normalize_phone
+
+# Глобальная монотонная последовательность версий для ленты изменений.
+# Каждая вставка/обновление здания, вида деятельности или организации
+# получает следующее значение.
+entity_version_seq = Sequence("entity_version_seq", metadata=Base.metadata)
+
+# Идентификатор транзакции, записавшей строку (64-битный, без переполнения)
+CURRENT_XACT_ID = text("pg_current_xact_id()::text::bigint")
+
+
+def version_column():
+    """Колонка версии строки для ленты изменений"""
+    return Column(
+        BigInteger,
+        server_default=text("nextval('entity_version_seq')"),
+        onupdate=entity_version_seq.next_value(),
+        nullable=False,
+    )
+
+
+def xact_id_column():
+    """Колонка транзакции последнего изменения строки.
+
+    Версия выдаётся при вставке, а видна строка становится при фиксации,
+    поэтому курсор ленты изменений упорядочен по (xact_id, version): все
+    транзакции, ещё способные зафиксироваться, имеют xact_id не меньше
+    горизонта pg_snapshot_xmin (см. ChangeService.get_changes).
+    """
+    return Column(BigInteger, server_default=CURRENT_XACT_ID, onupdate=CURRENT_XACT_ID, nullable=False)
+
+
+def updated_at_column():
+    """Колонка времени последнего изменения строки"""
+    return Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
 # Таблица для связи многие-ко-многим между организациями и видами деятельности
 organization_activity = Table(
@@ -15,7 +52,7 @@ organization_phone = Table(
     'organization_phone',
     Base.metadata,
     Column('organization_id', Integer, ForeignKey('organizations.id')),
-    Column('phone_id', Integer, ForeignKey('phones.id'))
+    Column('phone_id', Integer, ForeignKey('phones.id'), index=True)
 )
 
 
@@ -25,6 +62,11 @@ class Phone(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String, unique=True, index=True, nullable=False)
+    # Номер из одних цифр (E.164 без "+") для поиска в любом формате
+    normalized = Column(
+        String, unique=True, index=True, nullable=False,
+        default=lambda context: normalize_phone(context.get_current_parameters()["number"])
+    )
     
     # Связь с организациями
     organizations = relationship("Organization", secondary=organization_phone, back_populates="phones")
@@ -38,9 +80,21 @@ class Building(Base):
     address = Column(String, nullable=False)
     latitude = Column(Float, nullable=False)  # Широта
     longitude = Column(Float, nullable=False)  # Долгота
+    # Ячейка географической сетки (см. app.geo.geo_cell)
+    geo_cell = Column(
+        Integer, nullable=False, index=True,
+        default=lambda context: geo_cell(
+            context.get_current_parameters()["latitude"], context.get_current_parameters()["longitude"]
+        )
+    )
+    updated_at = updated_at_column()
+    version = version_column()
+    xact_id = xact_id_column()
     
     # Связь с организациями (один-ко-многим)
     organizations = relationship("Organization", back_populates="building")
+    
+    __table_args__ = (Index('ix_buildings_xact_id_version', 'xact_id', 'version'),)
 
 
 class Activity(Base):
@@ -50,11 +104,16 @@ class Activity(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     parent_id = Column(Integer, ForeignKey('activities.id'), nullable=True)
+    updated_at = updated_at_column()
+    version = version_column()
+    xact_id = xact_id_column()
     
     # Связи
     parent = relationship("Activity", remote_side=[id], back_populates="children")
     children = relationship("Activity", back_populates="parent")
     organizations = relationship("Organization", secondary=organization_activity, back_populates="activities")
+    
+    __table_args__ = (Index('ix_activities_xact_id_version', 'xact_id', 'version'),)
 
 
 class Organization(Base):
@@ -64,8 +123,93 @@ class Organization(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     building_id = Column(Integer, ForeignKey('buildings.id'), nullable=False)
+    updated_at = updated_at_column()
+    version = version_column()
+    xact_id = xact_id_column()
     
     # Связи
     building = relationship("Building", back_populates="organizations")
     activities = relationship("Activity", secondary=organization_activity, back_populates="organizations")
     phones = relationship("Phone", secondary=organization_phone, back_populates="organizations")
+    
+    __table_args__ = (Index('ix_organizations_xact_id_version', 'xact_id', 'version'),)
+
+
+class OrganizationRead(Base):
+    """Денормализованная модель чтения: одна строка на организацию.
+
+    Обновляется в той же транзакции, что и запись организации
+    (см. OrganizationReadService), и позволяет отдавать организации
+    сканированием одной таблицы по индексам.
+    """
+    __tablename__ = "organization_read"
+    
+    organization_id = Column(Integer, ForeignKey('organizations.id', ondelete='CASCADE'), primary_key=True)
+    # Ключ секционирования: таблица разбита на секции по полосам широт.
+    # Запрос без условия по geo_cell просматривает все секции: выборка по
+    # зданию сначала берёт ячейку здания по первичному ключу buildings, а
+    # выборки по id и телефону проверяют индексы первичного ключа всех секций
+    # одним запросом. Выборки по виду деятельности и названию идут по всем секциям.
+    geo_cell = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    building_id = Column(Integer, nullable=False, index=True)
+    address = Column(String, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    phones = Column(JSONB, nullable=False, default=list)  # [{"id": ..., "number": ...}]
+    activity_ids = Column(ARRAY(Integer), nullable=False, default=list)
+    # Виды деятельности организации вместе со всеми их предками
+    activity_ancestor_ids = Column(ARRAY(Integer), nullable=False, default=list)
+    
+    __table_args__ = (
+        Index('ix_organization_read_geo_cell_lat_lon', 'geo_cell', 'latitude', 'longitude'),
+        Index('ix_organization_read_activity_ancestor_ids', 'activity_ancestor_ids', postgresql_using='gin'),
+        {'postgresql_partition_by': 'RANGE (geo_cell)'},
+    )
+
+
+# Секции organization_read создаются вместе с таблицей (для create_all;
+# в миграциях - 006_geo_partitioning)
+for _suffix, _start, _end in partition_bounds():
+    event.listen(
+        OrganizationRead.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TABLE organization_read_{_suffix} PARTITION OF organization_read "
+            f"FOR VALUES FROM ({_start}) TO ({_end})"
+        ).execute_if(dialect="postgresql"),
+    )
+
+
+class DataVersion(Base):
+    """Версия данных справочника для ключей кэшей воркеров.
+
+    Единственная строка, увеличивается в той же транзакции, что и любая
+    запись в справочник (см. ChangeService.bump_data_version), поэтому
+    видимое значение всегда соответствует зафиксированным данным.
+    """
+    __tablename__ = "data_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+# Строка счётчика создаётся вместе с таблицей (в миграциях - 008_data_version)
+event.listen(
+    DataVersion.__table__,
+    "after_create",
+    DDL("INSERT INTO data_version (id, version) VALUES (1, 0)"),
+)
+
+
+class ApiKey(Base):
+    """API ключ клиента (тенанта) с собственным лимитом запросов"""
+    __tablename__ = "api_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    key_hash = Column(String, unique=True, index=True, nullable=False)  # SHA-256 ключа
+    rate_per_second = Column(Float, nullable=False, default=10.0)
+    burst = Column(Integer, nullable=False, default=20)
+    is_active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,20 @@
+import re
+
+# Только ASCII-цифры, как [^0-9] в SQL-заполнении миграции 003
+NON_DIGITS = re.compile(r"[^0-9]")
+
+
+def normalize_phone(number: str) -> str:
+    """Привести номер телефона к виду только из цифр.
+
+    Российские номера приводятся к E.164 без "+": "8-923-666-13-13",
+    "+7 (923) 666-13-13" и "9236661313" дают "79236661313". Короткие
+    местные номера ("2-222-222") остаются просто цифрами, номер без цифр
+    даёт пустую строку.
+    """
+    digits = NON_DIGITS.sub("", number)
+    if len(digits) == 11 and digits.startswith("8"):
+        return "7" + digits[1:]
+    if len(digits) == 10:
+        return "7" + digits
+    return digits
@@ -0,0 +1,271 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from typing import Any, Awaitable, Callable, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Настройки профилирования
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/orgatlas-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_HEADER = "X-Profile"
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+# Имена параметров строки запроса, которые не записываются в профиль
+REDACTED_QUERY_PARAMS = {"api_key"}
+
+
+class RequestProfile:
+    """Профиль одного запроса: SQL-запросы и статистика cProfile.
+
+    cProfile ставит на поток единственный обработчик sys.setprofile, поэтому
+    профилировщик включается только на участки, которые выполняют работу
+    именно этого запроса (шаги его корутины в цикле событий и вызовы в пуле
+    потоков), а результаты участков складываются в общую статистику.
+    """
+
+    def __init__(self):
+        self.queries: List[dict] = []
+        self.stats: Optional[pstats.Stats] = None
+        self._lock = Lock()
+
+    @contextmanager
+    def section(self):
+        """Профилировать блок в текущем потоке.
+
+        Если на потоке уже работает профилировщик (другой участок или
+        внешний инструмент), блок выполняется без профилирования.
+        """
+        if sys.getprofile() is not None:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+
+    def report(self, limit: int = 50) -> str:
+        """Текстовый отчёт pstats, отсортированный по cumulative"""
+        if self.stats is None:
+            return ""
+        output = io.StringIO()
+        self.stats.stream = output
+        self.stats.sort_stats("cumulative").print_stats(limit)
+        return output.getvalue()
+
+
+# Профиль текущего запроса (None - профилирование выключено).
+# Контекст копируется в задачи и в пул потоков, поэтому профиль доступен там же.
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is None or not conn.info.get("query_start_time"):
+        return
+    started = conn.info["query_start_time"].pop()
+    profile.queries.append({
+        "statement": statement,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+    })
+
+
+def profiled(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Обернуть функцию для пула потоков: профилировать её в потоке-исполнителе"""
+    @wraps(fn)
+    def wrapper(*args: Any) -> Any:
+        profile = current_profile.get()
+        if profile is None:
+            return fn(*args)
+        with profile.section():
+            return fn(*args)
+    return wrapper
+
+
+class _ProfiledSteps:
+    """Awaitable, профилирующий только шаги обёрнутой корутины.
+
+    Между шагами (во время await) цикл событий выполняет другие запросы,
+    и в это время профилировщик выключен.
+    """
+
+    def __init__(self, coroutine: Awaitable, profile: RequestProfile):
+        self.coroutine = coroutine
+        self.profile = profile
+
+    def __await__(self):
+        steps = self.coroutine.__await__()
+        value, error = None, None
+        while True:
+            try:
+                with self.profile.section():
+                    yielded = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            value, error = None, None
+            try:
+                value = yield yielded
+            except GeneratorExit:
+                steps.close()
+                raise
+            except BaseException as e:
+                error = e
+
+
+def should_profile(request: Request) -> bool:
+    """Профилировать ли запрос: по привилегированному заголовку или по выборке"""
+    if PROFILE_TOKEN and secrets.compare_digest(request.headers.get(PROFILE_HEADER, ""), PROFILE_TOKEN):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def save_profile(record: dict) -> None:
+    """Записать профиль в кольцевой буфер на диске, удалив самые старые"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{record['id']}.json"), "w") as f:
+        json.dump(record, f, ensure_ascii=False)
+
+    files = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    for name in files[:-PROFILE_MAX_FILES]:
+        os.remove(os.path.join(PROFILE_DIR, name))
+
+
+def redact_query(query: str) -> str:
+    """Строка запроса без секретных параметров"""
+    return urlencode([
+        (name, value) for name, value in parse_qsl(query, keep_blank_values=True)
+        if name not in REDACTED_QUERY_PARAMS
+    ])
+
+
+def list_profiles() -> List[dict]:
+    """Список сохранённых профилей, новые первыми"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            # Файл мог быть удалён или ещё не дописан другим воркером
+            continue
+        profiles.append({
+            "id": record["id"],
+            "method": record["method"],
+            "path": record["path"],
+            "status_code": record["status_code"],
+            "error": record.get("error"),
+            "duration_ms": record["duration_ms"],
+            "queries_count": len(record["queries"]),
+            "created_at": record["created_at"],
+        })
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Путь к файлу профиля или None, если профиля нет"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """Снять профиль cProfile и список SQL-запросов для выбранного запроса.
+
+    ASGI-middleware, а не BaseHTTPMiddleware: обработчик выполняется в той же
+    задаче, поэтому можно профилировать только шаги этого запроса.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        if request.url.path.startswith("/api/v1/admin/") or not should_profile(request):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        status_code = None
+
+        async def send_with_profile_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(raw=message["headers"])["X-Profile-Id"] = profile_id
+            await send(message)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+        error = None
+        try:
+            await _ProfiledSteps(self.app(scope, receive, send_with_profile_id), profile)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            current_profile.reset(token)
+            record = {
+                "id": profile_id,
+                "method": request.method,
+                "path": request.url.path,
+                "query": redact_query(request.url.query),
+                # Ответ не начат - обработчик упал или запрос отменён
+                "status_code": status_code if status_code is not None else 500,
+                "error": repr(error) if error is not None else None,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "created_at": time.time(),
+                "queries": profile.queries,
+                "profile": profile.report(),
+            }
+            # Синхронно: после отмены задачи await в finally может быть снова прерван
+            try:
+                save_profile(record)
+            except OSError:
+                logger.exception("Не удалось сохранить профиль %s", profile_id)
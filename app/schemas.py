@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
 from datetime import datetime
 
 
@@ -73,5 +73,69 @@ class Organization(OrganizationBase):
         from_attributes = True
 
 
+class ActivityFacet(ActivityBase):
+    """Вид деятельности с числом организаций по всему поддереву"""
+    id: int
+    organizations_count: int
+
+
+class Suggestion(BaseModel):
+    """Подсказка автодополнения"""
+    kind: str
+    id: int
+    name: str
+
+
+class ApiKeyCreate(BaseModel):
+    name: str
+    rate_per_second: float = Field(10.0, gt=0)
+    burst: int = Field(20, ge=1)
+
+
+class ApiKeyInfo(BaseModel):
+    id: int
+    name: str
+    rate_per_second: float
+    burst: int
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+
+
+class ApiKeyCreated(ApiKeyInfo):
+    """Созданный ключ: значение key показывается только один раз"""
+    key: str
+
+
+# Схемы ленты изменений
+class ActivityShort(ActivityBase):
+    """Вид деятельности без вложенных дочерних элементов"""
+    id: int
+
+    class Config:
+        from_attributes = True
+
+
+class OrganizationChange(OrganizationBase):
+    """Плоское представление организации для синхронизации"""
+    id: int
+    phone_numbers: List[str] = []
+    activity_ids: List[int] = []
+
+
+class ChangeEntry(BaseModel):
+    entity: str
+    version: int
+    updated_at: datetime
+    data: Union[Building, ActivityShort, OrganizationChange]
+
+
+class ChangeFeed(BaseModel):
+    changes: List[ChangeEntry]
+    cursor: str  # "<xact_id>-<version>" последнего изменения в ответе
+    has_more: bool
+
+
 # Обновляем forward references
 Activity.model_rebuild()
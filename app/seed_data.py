@@ -8,8 +8,9 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine
-from app.models import Base, Organization, Building, Activity, Phone
-from app.services import OrganizationService, BuildingService, ActivityService
+from app.auth import hash_key
+from app.models import Base, Organization, Building, Activity, Phone, ApiKey
+from app.services import OrganizationService, BuildingService, ActivityService, OrganizationReadService, ChangeService
 
 def create_test_data():
     """Создает тестовые данные в базе данных"""
@@ -21,6 +22,11 @@ def create_test_data():
     db = SessionLocal()
     
     try:
+        # API ключ для локальной разработки
+        if not db.query(ApiKey).filter(ApiKey.key_hash == hash_key("orgatlas_api_key")).first():
+            db.add(ApiKey(name="legacy", key_hash=hash_key("orgatlas_api_key"), rate_per_second=50.0, burst=100))
+            db.commit()
+        
         # Проверяем, есть ли уже данные
         existing_organizations = db.query(Organization).count()
         if existing_organizations > 0:
@@ -237,6 +243,11 @@ def create_test_data():
             
             db.add(organization)
         
+        # Заполняем модель чтения организаций
+        db.flush()
+        OrganizationReadService.rebuild(db)
+        ChangeService.bump_data_version(db)
+        
         # Сохраняем все изменения
         db.commit()
         
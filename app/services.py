@@ -1,81 +1,187 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from app.models import Organization, Building, Activity, Phone
-from app.schemas import OrganizationCreate, BuildingCreate, ActivityCreate
-from typing import List, Optional
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, or_, func, text, select, distinct, tuple_
+from app.autocomplete import autocomplete_index
+from app import geo
+from app.cache import VersionedCache
+from app.invalidation import notify_change, register_invalidator
+from app.models import ApiKey, DataVersion, Organization, OrganizationRead, Building, Activity, Phone, organization_activity, organization_phone
+from app.phones import normalize_phone
+from app.schemas import (
+    OrganizationCreate, BuildingCreate, ActivityCreate, ApiKeyCreate,
+    ChangeEntry, ChangeFeed, ActivityShort, ActivityFacet, OrganizationChange,
+    Building as BuildingSchema, Organization as OrganizationSchema,
+    Activity as ActivitySchema, Phone as PhoneSchema,
+)
+from typing import Dict, List, Optional, Tuple
+import heapq
+import itertools
 import math
 
 
+def geo_cell_condition(cell_column, min_lat: float, max_lat: float, min_lon: float, max_lon: float):
+    """Условие по ячейкам сетки, покрывающим прямоугольник.
+
+    Позволяет планировщику отбросить секции organization_read и сузить
+    сканирование индекса по geo_cell.
+    """
+    cells = geo.covering_cells(min_lat, max_lat, min_lon, max_lon)
+    if cells:
+        return cell_column.in_(cells)
+    return cell_column.between(*geo.cell_range(min_lat, max_lat))
+
+
+def radius_condition(latitude: float, longitude: float, radius_km: float,
+                     lat_column=Building.latitude, lon_column=Building.longitude,
+                     cell_column=Building.geo_cell):
+    """Условие попадания точки (lat_column, lon_column) в радиус от точки"""
+    # Формула гаверсинуса для расчета расстояния
+    earth_radius = 6371  # Радиус Земли в км
+    
+    # Ограничивающий прямоугольник отсекает строки по индексу до вычисления формулы
+    lat_delta = math.degrees(radius_km / earth_radius)
+    cos_lat = math.cos(math.radians(latitude))
+    if abs(latitude) + lat_delta >= 90 or cos_lat <= 1e-6:
+        # Круг накрывает полюс: подходят все долготы
+        lon_delta = 180
+    else:
+        lon_delta = math.degrees(radius_km / (earth_radius * cos_lat))
+    
+    return and_(
+        rectangle_condition(
+            latitude - lat_delta, latitude + lat_delta,
+            longitude - lon_delta, longitude + lon_delta,
+            lat_column, lon_column, cell_column
+        ),
+        func.acos(
+            func.least(1.0,
+                func.sin(func.radians(latitude)) * func.sin(func.radians(lat_column)) +
+                func.cos(func.radians(latitude)) * func.cos(func.radians(lat_column)) *
+                func.cos(func.radians(longitude) - func.radians(lon_column))
+            )
+        ) * earth_radius <= radius_km
+    )
+
+
+def rectangle_condition(min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+                        lat_column=Building.latitude, lon_column=Building.longitude,
+                        cell_column=Building.geo_cell):
+    """Условие попадания точки (lat_column, lon_column) в прямоугольную область.
+
+    Область может пересекать антимеридиан: долготы за пределами [-180, 180]
+    приводятся к нему, а min_lon > max_lon означает полосу через 180.
+    """
+    return and_(
+        geo_cell_condition(cell_column, min_lat, max_lat, min_lon, max_lon),
+        lat_column >= min_lat,
+        lat_column <= max_lat,
+        or_(*[
+            and_(lon_column >= west, lon_column <= east)
+            for west, east in geo.longitude_ranges(min_lon, max_lon)
+        ])
+    )
+
+
+# Кэш счётчиков организаций по видам деятельности, ключ - параметры фильтра
+facet_cache = VersionedCache(max_entries=512)
+register_invalidator({"activity", "organization"}, lambda change: facet_cache.clear())
+
+# Дерево видов деятельности в виде схем, ключ - версия данных
+activity_tree_cache = VersionedCache(max_entries=4)
+register_invalidator({"activity"}, lambda change: activity_tree_cache.clear())
+
+
 class OrganizationService:
     @staticmethod
-    def get_organizations_by_building(db: Session, building_id: int) -> List[Organization]:
+    def get_organizations_by_building(db: Session, building_id: int) -> List[OrganizationSchema]:
         """Получить все организации в конкретном здании"""
-        return db.query(Organization).filter(Organization.building_id == building_id).all()
+        # Ячейка здания по первичному ключу buildings: чтение затрагивает одну
+        # секцию organization_read и идёт по её индексу building_id
+        building_cell = db.query(Building.geo_cell).filter(Building.id == building_id).scalar()
+        if building_cell is None:
+            return []
+        return OrganizationReadService.read(
+            db, OrganizationRead.building_id == building_id, OrganizationRead.geo_cell == building_cell
+        )
     
     @staticmethod
-    def get_organizations_by_activity(db: Session, activity_id: int) -> List[Organization]:
+    def get_organizations_by_activity(db: Session, activity_id: int) -> List[OrganizationSchema]:
         """Получить все организации по виду деятельности (включая дочерние)"""
-        # Получаем все дочерние деятельности
-        child_activities = ActivityService.get_all_child_activities(db, activity_id)
-        activity_ids = [activity_id] + [child.id for child in child_activities]
-        
-        return db.query(Organization).join(Organization.activities).filter(
-            Organization.activities.any(Activity.id.in_(activity_ids))
-        ).all()
+        # Предки каждого вида деятельности хранятся в модели чтения (GIN-индекс)
+        return OrganizationReadService.read(
+            db, OrganizationRead.activity_ancestor_ids.contains([activity_id])
+        )
     
     @staticmethod
-    def get_organizations_in_radius(db: Session, latitude: float, longitude: float, radius_km: float) -> List[Organization]:
+    def get_organizations_in_radius(db: Session, latitude: float, longitude: float, radius_km: float) -> List[OrganizationSchema]:
         """Получить организации в радиусе от точки"""
-        # Формула гаверсинуса для расчета расстояния
-        earth_radius = 6371  # Радиус Земли в км
-        
-        # SQL запрос с использованием формулы гаверсинуса
-        query = db.query(Organization).join(Building).filter(
-            func.acos(
-                func.sin(func.radians(latitude)) * func.sin(func.radians(Building.latitude)) +
-                func.cos(func.radians(latitude)) * func.cos(func.radians(Building.latitude)) *
-                func.cos(func.radians(longitude) - func.radians(Building.longitude))
-            ) * earth_radius <= radius_km
-        )
-        
-        return query.all()
+        return OrganizationReadService.read(db, radius_condition(
+            latitude, longitude, radius_km,
+            OrganizationRead.latitude, OrganizationRead.longitude, OrganizationRead.geo_cell
+        ))
     
     @staticmethod
     def get_organizations_in_rectangle(db: Session, min_lat: float, max_lat: float, 
-                                     min_lon: float, max_lon: float) -> List[Organization]:
+                                     min_lon: float, max_lon: float) -> List[OrganizationSchema]:
         """Получить организации в прямоугольной области"""
-        return db.query(Organization).join(Building).filter(
-            and_(
-                Building.latitude >= min_lat,
-                Building.latitude <= max_lat,
-                Building.longitude >= min_lon,
-                Building.longitude <= max_lon
-            )
-        ).all()
+        return OrganizationReadService.read(db, rectangle_condition(
+            min_lat, max_lat, min_lon, max_lon,
+            OrganizationRead.latitude, OrganizationRead.longitude, OrganizationRead.geo_cell
+        ))
+    
+    @staticmethod
+    def get_organizations_by_phone(db: Session, phone: str) -> List[OrganizationSchema]:
+        """Получить организации по номеру телефона в любом формате"""
+        normalized = normalize_phone(phone)
+        if not normalized:
+            return []
+        organization_ids = select(organization_phone.c.organization_id).join(
+            Phone, Phone.id == organization_phone.c.phone_id
+        ).where(Phone.normalized == normalized)
+        return OrganizationReadService.read(db, OrganizationRead.organization_id.in_(organization_ids))
     
     @staticmethod
-    def get_organization_by_id(db: Session, org_id: int) -> Optional[Organization]:
+    def get_organization_by_id(db: Session, org_id: int) -> Optional[OrganizationSchema]:
         """Получить организацию по ID"""
-        return db.query(Organization).filter(Organization.id == org_id).first()
+        # Один запрос по первичному ключу: ячейка неизвестна, поэтому PostgreSQL
+        # проверяет индекс первичного ключа каждой секции, но это дешевле,
+        # чем отдельный запрос за ячейкой
+        organizations = OrganizationReadService.read(db, OrganizationRead.organization_id == org_id)
+        return organizations[0] if organizations else None
     
     @staticmethod
-    def search_organizations_by_name(db: Session, name: str) -> List[Organization]:
+    def search_organizations_by_name(db: Session, name: str) -> List[OrganizationSchema]:
         """Поиск организаций по названию"""
-        return db.query(Organization).filter(
-            Organization.name.ilike(f"%{name}%")
-        ).all()
+        return OrganizationReadService.read(db, OrganizationRead.name.ilike(f"%{name}%"))
+    
+    @staticmethod
+    def search_organizations_by_activity(db: Session, activity_name: str) -> List[OrganizationSchema]:
+        """Поиск организаций по названию вида деятельности (включая дочерние)"""
+        # Сначала найдем вид деятельности по названию
+        activity = db.query(Activity).filter(Activity.name.ilike(f"%{activity_name}%")).first()
+        if not activity:
+            return []
+        
+        # Получим все организации с этим видом деятельности и дочерними
+        return OrganizationService.get_organizations_by_activity(db, activity.id)
     
     @staticmethod
     def create_organization(db: Session, org_data: OrganizationCreate) -> Organization:
         """Создать новую организацию"""
+        # Проверяем телефоны до записи: номер без цифр не с чем сопоставить
+        normalized_numbers = [normalize_phone(number) for number in org_data.phone_numbers]
+        for phone_number, normalized in zip(org_data.phone_numbers, normalized_numbers):
+            if not normalized:
+                raise ValueError(f"Номер телефона не содержит цифр: {phone_number!r}")
+
         # Создаем телефоны
         phones = []
-        for phone_number in org_data.phone_numbers:
-            existing_phone = db.query(Phone).filter(Phone.number == phone_number).first()
+        for phone_number, normalized in zip(org_data.phone_numbers, normalized_numbers):
+            existing_phone = db.query(Phone).filter(Phone.normalized == normalized).first()
             if existing_phone:
-                phones.append(existing_phone)
+                if existing_phone not in phones:
+                    phones.append(existing_phone)
             else:
-                phone = Phone(number=phone_number)
+                phone = Phone(number=phone_number, normalized=normalized)
                 db.add(phone)
                 db.flush()
                 phones.append(phone)
@@ -92,11 +198,84 @@ class OrganizationService:
         )
         
         db.add(organization)
+        db.flush()
+        OrganizationReadService.refresh(db, organization)
+        ChangeService.bump_data_version(db)
+        notify_change(db, "organization", organization.id, name=organization.name)
         db.commit()
         db.refresh(organization)
+        autocomplete_index.add("organization", organization.id, organization.name)
         return organization
 
 
+class OrganizationReadService:
+    @staticmethod
+    def refresh(db: Session, organization: Organization) -> OrganizationRead:
+        """Пересчитать строку модели чтения для организации в текущей транзакции"""
+        ancestor_ids = set()
+        for activity in organization.activities:
+            current = activity
+            while current is not None and current.id not in ancestor_ids:
+                ancestor_ids.add(current.id)
+                current = current.parent
+        
+        building = organization.building
+        # Ячейка могла измениться вместе со зданием, а она входит в первичный ключ
+        db.query(OrganizationRead).filter(
+            OrganizationRead.organization_id == organization.id
+        ).delete(synchronize_session=False)
+        row = OrganizationRead(
+            organization_id=organization.id,
+            geo_cell=building.geo_cell,
+            name=organization.name,
+            building_id=building.id,
+            address=building.address,
+            latitude=building.latitude,
+            longitude=building.longitude,
+            phones=[{"id": phone.id, "number": phone.number} for phone in organization.phones],
+            activity_ids=sorted(activity.id for activity in organization.activities),
+            activity_ancestor_ids=sorted(ancestor_ids),
+        )
+        db.add(row)
+        return row
+    
+    @staticmethod
+    def rebuild(db: Session) -> None:
+        """Пересчитать модель чтения для всех организаций"""
+        organizations = db.query(Organization).options(
+            selectinload(Organization.building),
+            selectinload(Organization.phones),
+            selectinload(Organization.activities),
+        ).all()
+        for organization in organizations:
+            OrganizationReadService.refresh(db, organization)
+    
+    @staticmethod
+    def read(db: Session, *conditions) -> List[OrganizationSchema]:
+        """Прочитать организации из модели чтения по условиям"""
+        rows = db.query(OrganizationRead).filter(*conditions).order_by(OrganizationRead.organization_id).all()
+        if not rows:
+            return []
+        
+        activities = ActivityService.get_activity_tree(db)
+        return [
+            OrganizationSchema(
+                id=row.organization_id,
+                name=row.name,
+                building_id=row.building_id,
+                building=BuildingSchema(
+                    id=row.building_id,
+                    address=row.address,
+                    latitude=row.latitude,
+                    longitude=row.longitude,
+                ),
+                phones=[PhoneSchema(**phone) for phone in row.phones],
+                activities=[activities[i] for i in row.activity_ids if i in activities],
+            )
+            for row in rows
+        ]
+
+
 class BuildingService:
     @staticmethod
     def get_all_buildings(db: Session) -> List[Building]:
@@ -113,6 +292,9 @@ class BuildingService:
         """Создать новое здание"""
         building = Building(**building_data.dict())
         db.add(building)
+        db.flush()
+        ChangeService.bump_data_version(db)
+        notify_change(db, "building", building.id)
         db.commit()
         db.refresh(building)
         return building
@@ -129,6 +311,29 @@ class ActivityService:
         """Получить вид деятельности по ID"""
         return db.query(Activity).filter(Activity.id == activity_id).first()
     
+    @staticmethod
+    def get_activity_tree(db: Session) -> Dict[int, ActivitySchema]:
+        """Все виды деятельности в виде схем с дочерними элементами, по id.
+
+        Дерево строится одним запросом и кэшируется по версии данных.
+        """
+        version = ChangeService.get_data_version(db)
+        tree = activity_tree_cache.get("tree", version)
+        if tree is not None:
+            return tree
+        
+        rows = db.query(Activity.id, Activity.name, Activity.parent_id).order_by(Activity.id).all()
+        tree = {
+            row.id: ActivitySchema(id=row.id, name=row.name, parent_id=row.parent_id, children=[])
+            for row in rows
+        }
+        for activity in tree.values():
+            if activity.parent_id in tree:
+                tree[activity.parent_id].children.append(activity)
+        
+        activity_tree_cache.set("tree", version, tree)
+        return tree
+    
     @staticmethod
     def get_all_child_activities(db: Session, parent_id: int, max_level: int = 3) -> List[Activity]:
         """Получить все дочерние виды деятельности (рекурсивно, до 3 уровня)"""
@@ -146,6 +351,60 @@ class ActivityService:
         
         return get_children_recursive(parent_id)
     
+    @staticmethod
+    def get_activity_facets(
+        db: Session,
+        radius: Optional[Tuple[float, float, float]] = None,
+        rectangle: Optional[Tuple[float, float, float, float]] = None,
+    ) -> List[ActivityFacet]:
+        """Получить число организаций для каждого вида деятельности с учётом поддерева.
+
+        radius - (широта, долгота, радиус в км), rectangle - (min_lat, max_lat,
+        min_lon, max_lon). Результат кэшируется по версии данных.
+        """
+        version = ChangeService.get_data_version(db)
+        key = (radius, rectangle)
+        facets = facet_cache.get(key, version)
+        if facets is not None:
+            return facets
+
+        # Замыкание иерархии: пары (предок, потомок), включая саму деятельность
+        closure = select(
+            Activity.id.label("ancestor_id"), Activity.id.label("activity_id")
+        ).cte("activity_closure", recursive=True)
+        closure = closure.union_all(
+            select(closure.c.ancestor_id, Activity.id).where(Activity.parent_id == closure.c.activity_id)
+        )
+
+        counts = select(
+            closure.c.ancestor_id,
+            func.count(distinct(organization_activity.c.organization_id)).label("organizations_count"),
+        ).join_from(
+            closure, organization_activity, organization_activity.c.activity_id == closure.c.activity_id
+        )
+        if radius is not None or rectangle is not None:
+            counts = counts.join(
+                Organization, Organization.id == organization_activity.c.organization_id
+            ).join(Building, Building.id == Organization.building_id)
+            if radius is not None:
+                counts = counts.where(radius_condition(*radius))
+            if rectangle is not None:
+                counts = counts.where(rectangle_condition(*rectangle))
+        counts = counts.group_by(closure.c.ancestor_id).subquery()
+
+        rows = db.execute(
+            select(
+                Activity.id,
+                Activity.name,
+                Activity.parent_id,
+                func.coalesce(counts.c.organizations_count, 0).label("organizations_count"),
+            ).outerjoin(counts, counts.c.ancestor_id == Activity.id).order_by(Activity.id)
+        ).all()
+
+        facets = [ActivityFacet.model_validate(row, from_attributes=True) for row in rows]
+        facet_cache.set(key, version, facets)
+        return facets
+    
     @staticmethod
     def create_activity(db: Session, activity_data: ActivityCreate) -> Activity:
         """Создать новый вид деятельности"""
@@ -159,8 +418,12 @@ class ActivityService:
         
         activity = Activity(**activity_data.dict())
         db.add(activity)
+        db.flush()
+        ChangeService.bump_data_version(db)
+        notify_change(db, "activity", activity.id, name=activity.name)
         db.commit()
         db.refresh(activity)
+        autocomplete_index.add("activity", activity.id, activity.name)
         return activity
     
     @staticmethod
@@ -174,3 +437,130 @@ class ActivityService:
             activity = db.query(Activity).filter(Activity.id == activity.parent_id).first()
         
         return level
+
+
+class ChangeService:
+    @staticmethod
+    def get_data_version(db: Session) -> int:
+        """Текущая версия данных справочника (зафиксированное значение счётчика)"""
+        return db.query(DataVersion.version).filter(DataVersion.id == 1).scalar()
+
+    @staticmethod
+    def bump_data_version(db: Session) -> None:
+        """Увеличить версию данных в текущей транзакции.
+
+        Вызывается при каждой записи в справочник. Строка счётчика остаётся
+        заблокированной до фиксации, поэтому пишущие транзакции выполняют
+        этот шаг по очереди.
+        """
+        db.query(DataVersion).filter(DataVersion.id == 1).update(
+            {DataVersion.version: DataVersion.version + 1}, synchronize_session=False
+        )
+
+    @staticmethod
+    def get_changes(db: Session, since: str = "0-0", limit: int = 500) -> ChangeFeed:
+        """Получить вставленные и изменённые сущности после курсора since.
+
+        Курсор - пара (xact_id, version) последней отданной строки. Версия
+        выдаётся при вставке, а видна строка становится при фиксации, поэтому
+        порядок по одной версии терял бы строки транзакций, зафиксированных
+        позже соседних. Отдаются только строки транзакций с xid меньше
+        горизонта pg_snapshot_xmin: все такие транзакции уже завершены, а
+        любая ещё не зафиксированная получит место в порядке после курсора.
+        Долгая транзакция задерживает ленту, но не приводит к потере строк.
+
+        Из каждой таблицы читается не больше limit + 1 строк по индексу
+        (xact_id, version), затем потоки сливаются, поэтому стоимость запроса
+        зависит от числа изменений, а не от размера справочника.
+        """
+        since_position = tuple(int(part) for part in since.split("-"))
+        horizon = db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+        def changed(model):
+            return and_(
+                tuple_(model.xact_id, model.version) > since_position,
+                model.xact_id < horizon,
+            )
+
+        buildings = db.query(Building).filter(
+            changed(Building)
+        ).order_by(Building.xact_id, Building.version).limit(limit + 1).all()
+
+        activities = db.query(Activity).filter(
+            changed(Activity)
+        ).order_by(Activity.xact_id, Activity.version).limit(limit + 1).all()
+
+        organizations = db.query(Organization).options(
+            selectinload(Organization.phones),
+            selectinload(Organization.activities),
+        ).filter(
+            changed(Organization)
+        ).order_by(Organization.xact_id, Organization.version).limit(limit + 1).all()
+
+        streams = [
+            (((b.xact_id, b.version), ChangeEntry(
+                entity="building",
+                version=b.version,
+                updated_at=b.updated_at,
+                data=BuildingSchema.model_validate(b),
+            )) for b in buildings),
+            (((a.xact_id, a.version), ChangeEntry(
+                entity="activity",
+                version=a.version,
+                updated_at=a.updated_at,
+                data=ActivityShort.model_validate(a),
+            )) for a in activities),
+            (((o.xact_id, o.version), ChangeEntry(
+                entity="organization",
+                version=o.version,
+                updated_at=o.updated_at,
+                data=OrganizationChange(
+                    id=o.id,
+                    name=o.name,
+                    building_id=o.building_id,
+                    phone_numbers=[p.number for p in o.phones],
+                    activity_ids=[a.id for a in o.activities],
+                ),
+            )) for o in organizations),
+        ]
+
+        merged = list(itertools.islice(heapq.merge(*streams, key=lambda item: item[0]), limit))
+        changes = [entry for _, entry in merged]
+
+        total = len(buildings) + len(activities) + len(organizations)
+        position = merged[-1][0] if merged else since_position
+        cursor = f"{position[0]}-{position[1]}"
+        return ChangeFeed(changes=changes, cursor=cursor, has_more=total > len(changes))
+
+
+class ApiKeyService:
+    @staticmethod
+    def get_all_api_keys(db: Session) -> List[ApiKey]:
+        """Получить все API ключи"""
+        return db.query(ApiKey).order_by(ApiKey.id).all()
+    
+    @staticmethod
+    def create_api_key(db: Session, key_data: ApiKeyCreate, key_hash: str) -> ApiKey:
+        """Создать API ключ (в базе хранится только хэш)"""
+        api_key = ApiKey(
+            name=key_data.name,
+            key_hash=key_hash,
+            rate_per_second=key_data.rate_per_second,
+            burst=key_data.burst,
+        )
+        db.add(api_key)
+        db.commit()
+        db.refresh(api_key)
+        return api_key
+    
+    @staticmethod
+    def deactivate_api_key(db: Session, key_id: int) -> Optional[ApiKey]:
+        """Отключить API ключ во всех воркерах"""
+        api_key = db.query(ApiKey).filter(ApiKey.id == key_id).first()
+        if not api_key:
+            return None
+        api_key.is_active = False
+        notify_change(db, "api_key", api_key.id)
+        db.commit()
+        db.refresh(api_key)
+        return api_key
@@ -0,0 +1,148 @@
+"""
+Кэш API ключей ограничен по размеру, а промахи кэша ограничены общим лимитом:
+перебор неизвестных ключей не доходит до базы, известные ключи продолжают
+работать по устаревшей записи.
+"""
+import pytest
+from fastapi import HTTPException
+
+from app import auth
+from app.auth import ApiKeyCache, TokenBucket, hash_key
+from app.schemas import ApiKeyInfo
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeSession:
+    """Сессия, отвечающая на запрос ключа по заранее известным хэшам"""
+
+    def __init__(self, keys, calls):
+        self.keys = keys
+        self.calls = calls
+        self.key_hash = None
+
+    def query(self, model):
+        return self
+
+    def filter(self, condition, *conditions):
+        self.key_hash = condition.right.value
+        return self
+
+    def first(self):
+        self.calls.append(self.key_hash)
+        return self.keys.get(self.key_hash)
+
+    def close(self):
+        pass
+
+
+def key_info(key_id: int) -> ApiKeyInfo:
+    return ApiKeyInfo(id=key_id, name=f"key-{key_id}", rate_per_second=10.0, burst=20, is_active=True)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(auth, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def database(monkeypatch, clock):
+    """Подменяет базу ключей: (известные ключи по хэшу, список обращений)"""
+    keys, calls = {}, []
+    monkeypatch.setattr(auth, "SessionLocal", lambda: FakeSession(keys, calls))
+    monkeypatch.setattr(auth, "api_key_cache", ApiKeyCache(max_entries=10))
+    monkeypatch.setattr(auth, "miss_limiter", TokenBucket(auth.API_KEY_MISS_RATE, auth.API_KEY_MISS_BURST))
+    return keys, calls
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = ApiKeyCache(max_entries=2)
+    cache.set("a", key_info(1))
+    cache.set("b", key_info(2))
+    assert cache.get("a") == (True, key_info(1))
+
+    cache.set("c", key_info(3))
+
+    assert len(cache) == 2
+    assert cache.get("b") == (False, None)
+    assert cache.get("a")[0] and cache.get("c")[0]
+
+
+def test_cache_evicts_expired_entries_first(clock):
+    cache = ApiKeyCache(max_entries=2)
+    cache.set("known", key_info(1))
+    cache.set("unknown", None)
+    clock.now += auth.API_KEY_NEGATIVE_TTL + 1
+    # Свежий ключ не вытесняет давно не использованный, пока есть истёкшие записи
+    cache.set("new", key_info(2))
+
+    assert len(cache) == 2
+    assert cache.get_stale("unknown") is None
+    assert cache.get("known") == (True, key_info(1))
+
+
+def test_cache_expires_entries(clock):
+    cache = ApiKeyCache()
+    cache.set("known", key_info(1))
+    clock.now += auth.API_KEY_CACHE_TTL + 1
+
+    assert cache.get("known") == (False, None)
+    assert cache.get_stale("known") == key_info(1)
+
+
+def test_cache_invalidate_drops_key_and_unknown_entries(clock):
+    cache = ApiKeyCache()
+    cache.set("first", key_info(1))
+    cache.set("second", key_info(2))
+    cache.set("unknown", None)
+
+    cache.invalidate(1)
+
+    assert cache.get("first") == (False, None)
+    assert cache.get("unknown") == (False, None)
+    assert cache.get("second") == (True, key_info(2))
+
+
+def test_lookup_caches_database_result(clock, database):
+    keys, calls = database
+    keys[hash_key("valid")] = key_info(1)
+
+    assert auth.lookup_api_key("valid") == key_info(1)
+    assert auth.lookup_api_key("valid") == key_info(1)
+    assert auth.lookup_api_key("missing") is None
+    assert auth.lookup_api_key("missing") is None
+    assert calls == [hash_key("valid"), hash_key("missing")]
+
+
+def test_miss_limiter_rejects_unknown_keys_without_database(clock, database, monkeypatch):
+    keys, calls = database
+    monkeypatch.setattr(auth, "miss_limiter", TokenBucket(rate=0.5, burst=1))
+
+    assert auth.lookup_api_key("guess-1") is None
+    with pytest.raises(HTTPException) as error:
+        auth.lookup_api_key("guess-2")
+
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "2"
+    assert calls == [hash_key("guess-1")]
+
+
+def test_miss_limiter_serves_known_key_from_stale_entry(clock, database, monkeypatch):
+    keys, calls = database
+    keys[hash_key("valid")] = key_info(1)
+    monkeypatch.setattr(auth, "miss_limiter", TokenBucket(rate=0.001, burst=1))
+
+    assert auth.lookup_api_key("valid") == key_info(1)
+    clock.now += auth.API_KEY_CACHE_TTL + 1
+
+    # Запись истекла, токенов на промах нет: ключ работает без обращения к базе
+    assert auth.lookup_api_key("valid") == key_info(1)
+    assert calls == [hash_key("valid")]
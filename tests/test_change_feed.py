@@ -0,0 +1,94 @@
+"""
+Лента изменений не теряет строки транзакций, зафиксированных не в порядке версий,
+а версия данных для кэшей меняется только при фиксации записи в справочник.
+
+Нужна отдельная база PostgreSQL: TEST_DATABASE_URL=postgresql://... pytest tests
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import ApiKey, Building
+from app.services import ChangeService
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine)
+    finally:
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def poll(session_factory, cursor):
+    db = session_factory()
+    try:
+        return ChangeService.get_changes(db, cursor)
+    finally:
+        db.close()
+
+
+def test_out_of_order_commit_is_delivered(session_factory):
+    # A берёт версию первой и остаётся открытой
+    first = session_factory()
+    first.add(Building(address="A", latitude=55.75, longitude=37.61))
+    first.flush()
+
+    # B берёт следующую версию и фиксируется раньше A
+    second = session_factory()
+    second.add(Building(address="B", latitude=55.76, longitude=37.62))
+    second.commit()
+    second.close()
+
+    delivered = []
+    feed = poll(session_factory, "0-0")
+    delivered += [entry.data.address for entry in feed.changes]
+
+    first.commit()
+    first.close()
+
+    feed = poll(session_factory, feed.cursor)
+    delivered += [entry.data.address for entry in feed.changes]
+
+    assert sorted(delivered) == ["A", "B"]
+    assert poll(session_factory, feed.cursor).changes == []
+
+
+def data_version(session_factory):
+    db = session_factory()
+    try:
+        return ChangeService.get_data_version(db)
+    finally:
+        db.close()
+
+
+def test_data_version_follows_directory_commits(session_factory):
+    initial = data_version(session_factory)
+
+    writer = session_factory()
+    writer.add(Building(address="C", latitude=55.77, longitude=37.63))
+    ChangeService.bump_data_version(writer)
+    writer.flush()
+    assert data_version(session_factory) == initial
+
+    # Запись вне справочника не сбрасывает кэши
+    other = session_factory()
+    other.add(ApiKey(name="tenant", key_hash="0" * 64))
+    other.commit()
+    other.close()
+    assert data_version(session_factory) == initial
+
+    writer.commit()
+    writer.close()
+    assert data_version(session_factory) == initial + 1
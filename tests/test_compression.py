@@ -0,0 +1,39 @@
+"""
+Выбор кодировки ответа по Accept-Encoding учитывает q-значения и "*",
+а br предпочитается gzip только при равных q.
+"""
+import pytest
+
+from app import compression
+from app.compression import choose_encoding
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    # choose_encoding проверяет только наличие модуля
+    monkeypatch.setattr(compression, "brotli", object())
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", "identity"),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.1, gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.5", "br"),
+    ("*", "br"),
+    ("*;q=0.2, gzip;q=0.1", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("gzip;q=0, br;q=0", "identity"),
+    ("gzip;q=0.5, identity", "identity"),
+    ("identity, gzip", "gzip"),
+    ("GZIP ; Q=0.8, deflate", "gzip"),
+])
+def test_choose_encoding(with_brotli, header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("br, gzip;q=0.1") == "gzip"
+    assert choose_encoding("br") == "identity"
+    assert choose_encoding("*") == "gzip"
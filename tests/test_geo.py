@@ -0,0 +1,66 @@
+"""
+Ячейки сетки и диапазоны долгот для гео-выборок, в том числе для областей,
+пересекающих антимеридиан.
+"""
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import geo
+from app.services import radius_condition
+
+
+def approx_ranges(ranges):
+    return [(pytest.approx(west), pytest.approx(east)) for west, east in ranges]
+
+
+@pytest.mark.parametrize("min_lon, max_lon, expected", [
+    (37.5, 37.7, [(37.5, 37.7)]),
+    (-180.0, 180.0, [(-180.0, 180.0)]),
+    (-200.0, 200.0, [(-180.0, 180.0)]),
+    (179.8, 180.2, [(179.8, 180.0), (-180.0, -179.8)]),
+    (179.8, -179.8, [(179.8, 180.0), (-180.0, -179.8)]),
+    (-180.4, -179.5, [(179.6, 180.0), (-180.0, -179.5)]),
+    (190.0, 200.0, [(-170.0, -160.0)]),
+])
+def test_longitude_ranges(min_lon, max_lon, expected):
+    assert geo.longitude_ranges(min_lon, max_lon) == approx_ranges(expected)
+
+
+def test_covering_cells_small_rectangle():
+    assert geo.covering_cells(55.7, 55.8, 37.5, 37.7) == [geo.geo_cell(55.75, 37.6)]
+
+
+def test_covering_cells_across_antimeridian():
+    cells = geo.covering_cells(64.8, 65.2, 179.8, -179.8)
+    assert sorted(cells) == sorted([
+        geo.geo_cell(64.9, 179.9), geo.geo_cell(64.9, -179.9),
+        geo.geo_cell(65.1, 179.9), geo.geo_cell(65.1, -179.9),
+    ])
+
+
+def test_covering_cells_too_many_cells():
+    assert geo.covering_cells(50.0, 60.0, 30.0, 40.0) == []
+
+
+def test_radius_near_antimeridian_covers_both_sides():
+    # Круг 20 км вокруг (65, -179.95) заходит на восточную сторону антимеридиана
+    condition = radius_condition(65.0, -179.95, 20.0)
+    sql = str(condition.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    cells = sql.split("geo_cell IN (", 1)[1].split(")", 1)[0]
+    cells = {int(cell) for cell in cells.split(",")}
+
+    assert geo.geo_cell(65.0, 179.95) == 56159
+    assert {geo.geo_cell(65.0, -179.95), geo.geo_cell(65.0, 179.95), geo.geo_cell(65.1, 179.9)} <= cells
+
+
+def test_partition_bounds_cover_all_cells():
+    bounds = geo.partition_bounds()
+    assert bounds[0] == ("s90", 0, 1800)
+    assert bounds[-1] == ("n85", 63000, geo.CELL_ROWS * geo.CELLS_PER_ROW)
+    assert all(prev[2] == cur[1] for prev, cur in zip(bounds, bounds[1:]))
+
+
+def test_cell_range_matches_geo_cell():
+    low, high = geo.cell_range(64.8, 65.2)
+    assert low <= geo.geo_cell(64.8, -180.0)
+    assert geo.geo_cell(65.2, 180.0) <= high
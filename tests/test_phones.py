@@ -0,0 +1,89 @@
+"""
+normalize_phone даёт то же, что SQL-заполнение phones.normalized в миграции 003,
+а организацию с номером без цифр создать нельзя.
+
+Сверка с SQL нужна отдельная база PostgreSQL: TEST_DATABASE_URL=postgresql://... pytest tests
+"""
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.phones import normalize_phone
+from app.schemas import OrganizationCreate
+from app.services import OrganizationService
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+MIGRATION_003 = Path(__file__).resolve().parent.parent / "alembic" / "versions" / "003_phone_normalized.py"
+
+CASES = [
+    ("2-222-222", "2222222"),
+    ("3-333-333", "3333333"),
+    ("8-923-666-13-13", "79236661313"),
+    ("+7 (923) 666-13-13", "79236661313"),
+    ("9236661313", "79236661313"),
+    ("8 (495) 123-45-67", "74951234567"),
+    ("+1 212 555 0100", "12125550100"),
+    ("89236661313", "79236661313"),
+    ("нет телефона", ""),
+    ("", ""),
+    ("٩٢٣٦٦٦١٣١٣", ""),
+]
+
+
+@pytest.mark.parametrize("number, expected", CASES)
+def test_normalize_phone(number, expected):
+    assert normalize_phone(number) == expected
+
+
+def test_create_organization_rejects_number_without_digits():
+    org_data = OrganizationCreate(name="Без телефона", building_id=1, phone_numbers=["2-222-222", "доб."])
+    # Проверка выполняется до обращения к базе
+    with pytest.raises(ValueError):
+        OrganizationService.create_organization(None, org_data)
+
+
+def backfill_statements():
+    """UPDATE-запросы заполнения phones.normalized из миграции 003"""
+    spec = importlib.util.spec_from_file_location("migration_003", MIGRATION_003)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    class RecordingOp:
+        def __init__(self):
+            self.statements = []
+
+        def execute(self, statement):
+            self.statements.append(statement)
+
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+    recording = RecordingOp()
+    migration.op = recording
+    migration.upgrade()
+    return [s for s in recording.statements if "SET normalized" in s]
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+def test_normalize_phone_matches_migration_backfill():
+    engine = create_engine(TEST_DATABASE_URL)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TEMPORARY TABLE phones (number varchar, normalized varchar)"))
+            conn.execute(
+                text("INSERT INTO phones (number) VALUES (:number)"),
+                [{"number": number} for number, _ in CASES],
+            )
+            for statement in backfill_statements():
+                conn.execute(text(statement))
+            rows = conn.execute(text("SELECT number, normalized FROM phones")).all()
+    finally:
+        engine.dispose()
+
+    assert {number: normalized for number, normalized in rows} == {
+        number: normalize_phone(number) for number, _ in CASES
+    }